@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'recipes.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,13 +76,51 @@ WSGI_APPLICATION = 'food_optimizer.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Overridable so tools like the load test can run against a scratch database
+SQLITE_PATH = os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3')
+
+# journal_mode=WAL is stored in the database file itself, so the checked-in
+# db.sqlite3 keeps its rollback journal and isn't rewritten by every run
+SQLITE_JOURNAL_MODE = os.getenv(
+    'SQLITE_JOURNAL_MODE', 'DELETE' if Path(SQLITE_PATH) == BASE_DIR / 'db.sqlite3' else 'WAL'
+)
+
+# Both aliases use the same SQLite file; the journal mode and the other
+# pragmas are set on connect by recipes.db.configure_sqlite, and ReadRouter
+# sends plain recipe/favorite reads to 'read' so with WAL they never queue
+# behind writers.
+# Writes start with BEGIN IMMEDIATE (see recipes/sqlite/base.py) so
+# concurrent transactions wait for the lock instead of failing.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'ENGINE': 'recipes.sqlite',
+        'NAME': SQLITE_PATH,
+        'JOURNAL_MODE': SQLITE_JOURNAL_MODE,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 5,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    'read': {
+        'ENGINE': 'recipes.sqlite',
+        'NAME': SQLITE_PATH,
+        'JOURNAL_MODE': SQLITE_JOURNAL_MODE,
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'READ_ONLY': True,
+        'OPTIONS': {
+            'timeout': 5,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['recipes.db.ReadRouter']
+
 
 # Cache configuration
 CACHES = {
@@ -90,6 +130,37 @@ CACHES = {
     }
 }
 
+# Shared cache for multi-process deployments; values are stored in the
+# compact msgpack/JSON + zlib format rather than pickled
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+        'OPTIONS': {
+            'serializer': 'recipes.serializers.CompactCacheSerializer',
+        },
+    }
+
+SESSION_SERIALIZER = 'recipes.serializers.CompactSessionSerializer'
+
+
+# Near-duplicate recipes found at ingestion: 'flag' stores the new URL with
+# duplicate_of set, 'merge' reuses the existing recipe row instead
+RECIPE_DEDUP_MODE = 'flag'
+
+# Token-bucket limits on expensive routes, by URL name: the methods covered
+# and (requests, seconds) for anonymous (per IP) and logged-in (per user)
+# clients. Buckets live in the default cache, so they only hold across
+# worker processes with a shared cache (REDIS_URL); see recipes/checks.py.
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') == '1'
+RATE_LIMITS = {
+    'index': {'methods': ['POST'], 'anonymous': (5, 60), 'authenticated': (20, 60)},
+    'recipe_job': {'methods': ['POST'], 'anonymous': (5, 60), 'authenticated': (20, 60)},
+    'login': {'methods': ['POST'], 'anonymous': (10, 60), 'authenticated': (10, 60)},
+    'signup': {'methods': ['POST'], 'anonymous': (5, 300), 'authenticated': (5, 300)},
+}
+RATE_LIMIT_EXEMPT = ['recipe', 'favorite']
+
 
 # Password validation
 
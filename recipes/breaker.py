@@ -0,0 +1,60 @@
+import time
+
+from django.core.cache import cache
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state lives in the default cache.
+
+    Closed: calls go through and consecutive failures are counted. After
+    failure_threshold failures the breaker opens and allow() returns False
+    for reset_timeout seconds, so callers go straight to their fallback.
+    Then it is half-open: one caller gets to probe; success closes the
+    breaker, failure opens it again. With a shared cache (REDIS_URL) that
+    state is common to all workers; with the per-process LocMemCache each
+    worker trips and probes on its own, which `check --deploy` reports
+    (recipes.W002).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, probe_timeout=15):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.failures_key = f"breaker_{name}_failures"
+        self.open_until_key = f"breaker_{name}_open_until"
+        self.probe_key = f"breaker_{name}_probe"
+
+    @property
+    def state(self):
+        open_until = cache.get(self.open_until_key)
+        if open_until is None:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half-open'
+
+    def allow(self):
+        """Whether a call should be attempted right now"""
+        open_until = cache.get(self.open_until_key)
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        # Half-open: only the worker that wins this add() sends the probe
+        return cache.add(self.probe_key, 1, self.probe_timeout)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_until_key, self.probe_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            failures = 1
+            cache.set(self.failures_key, failures, None)
+
+        half_open = cache.get(self.open_until_key) is not None
+        if half_open or failures >= self.failure_threshold:
+            cache.set(self.open_until_key, time.time() + self.reset_timeout, None)
+            cache.delete(self.probe_key)
@@ -0,0 +1,212 @@
+import csv
+import json
+import time
+
+from .charts import bump_favorites_version
+from .dedup import lsh_index
+from .models import Favorite, Recipe
+from .similarity import recipe_index
+
+# Columns in every export format, in order
+EXPORT_FIELDS = ['source_url', 'title', 'instructions', 'ingredients', 'nutrition', 'minhash', 'duplicate_of_url']
+
+# Columns holding lists/dicts; CSV stores them as JSON text
+JSON_FIELDS = {'ingredients', 'nutrition', 'minhash'}
+
+# Fields refreshed when an imported source_url already exists; updated_at is
+# how other workers' in-memory indexes notice the change
+UPDATE_FIELDS = ['title', 'instructions', 'ingredients', 'nutrition', 'minhash', 'updated_at']
+
+EXPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 500
+
+
+def iter_export_rows(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one dict per recipe, reading the table in chunks so memory stays flat"""
+    queryset = (Recipe.objects.order_by('id')
+                .values('source_url', 'title', 'instructions', 'ingredients', 'nutrition', 'minhash',
+                        'duplicate_of__source_url'))
+    for row in queryset.iterator(chunk_size=chunk_size):
+        row['duplicate_of_url'] = row.pop('duplicate_of__source_url')
+        yield row
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([
+            json.dumps(row[field]) if field in JSON_FIELDS else (row[field] or '')
+            for field in EXPORT_FIELDS
+        ])
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet support needs pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def write_parquet(rows, path, batch_size=EXPORT_CHUNK_SIZE):
+    """Write rows to a Parquet file one row group per batch; JSON columns are stored as strings"""
+    pa = _require_pyarrow()
+    schema = pa.schema([(field, pa.string()) for field in EXPORT_FIELDS])
+    count = 0
+    with pa.parquet.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append({field: json.dumps(row[field]) if field in JSON_FIELDS else row[field]
+                          for field in EXPORT_FIELDS})
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def read_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_csv(lines):
+    for row in csv.DictReader(lines):
+        yield {
+            field: json.loads(value) if field in JSON_FIELDS and value else (value or None)
+            for field, value in row.items()
+        }
+
+
+def read_parquet(path, batch_size=EXPORT_CHUNK_SIZE):
+    pa = _require_pyarrow()
+    parquet_file = pa.parquet.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        for row in batch.to_pylist():
+            yield {
+                field: json.loads(value) if field in JSON_FIELDS and value else value
+                for field, value in row.items()
+            }
+
+
+def _chunks(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _link_duplicates(links, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Set duplicate_of from {source_url: duplicate_of_url} in bulk; return how many could not be resolved.
+
+    Run once after every batch is in, so a link can point at a row imported later.
+    """
+    urls = set(links) | set(links.values())
+    ids = {}
+    for chunk in _chunks(urls, batch_size):
+        ids.update(Recipe.objects.filter(source_url__in=chunk).values_list('source_url', 'id'))
+    updates = [
+        Recipe(id=ids[url], duplicate_of_id=ids[duplicate_url])
+        for url, duplicate_url in links.items() if url in ids and duplicate_url in ids
+    ]
+    Recipe.objects.bulk_update(updates, ['duplicate_of'], batch_size=batch_size)
+    return len(links) - len(updates)
+
+
+def _refresh_after_import(user_ids):
+    """
+    Do what post_save would have done for rows written by bulk_create.
+
+    Indexes loaded in this process are refreshed (other workers pick the
+    rows up by updated_at) and the favorites charts of user_ids, who have
+    an imported recipe among their favorites, are invalidated.
+    """
+    for index in (recipe_index, lsh_index):
+        if index.loaded_at is not None:
+            index.refresh()
+    for user_id in user_ids:
+        bump_favorites_version(user_id)
+
+
+def import_rows(rows, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Upsert exported rows into Recipe in batches.
+
+    Each batch is one bulk_create that updates existing rows on a
+    source_url conflict. Rows without a source_url can't be matched on a
+    later import, so they are skipped rather than re-inserted each time.
+    duplicate_of links are resolved by URL in one pass at the end; links to
+    recipes missing from the catalog are dropped. Returns counts and
+    throughput.
+    """
+    started = time.perf_counter()
+    total = skipped = 0
+    links = {}
+    favorited_by = set()
+    batch = {}
+
+    def flush():
+        Recipe.objects.bulk_create(
+            list(batch.values()),
+            update_conflicts=True,
+            unique_fields=['source_url'],
+            update_fields=UPDATE_FIELDS,
+        )
+        favorited_by.update(
+            Favorite.objects.filter(recipe__source_url__in=list(batch)).values_list('user_id', flat=True)
+        )
+
+    for row in rows:
+        url = row.get('source_url')
+        if not url:
+            skipped += 1
+            continue
+        # A URL repeated within a batch keeps its last row
+        batch[url] = Recipe(
+            source_url=url,
+            title=row.get('title') or '',
+            instructions=row.get('instructions') or '',
+            ingredients=row.get('ingredients') or [],
+            nutrition=row.get('nutrition') or {},
+            minhash=row.get('minhash') or [],
+        )
+        duplicate_url = row.get('duplicate_of_url')
+        if duplicate_url and duplicate_url != url:
+            links[url] = duplicate_url
+        total += 1
+        if len(batch) >= batch_size:
+            flush()
+            batch = {}
+    if batch:
+        flush()
+
+    unlinked = _link_duplicates(links, batch_size)
+    _refresh_after_import(favorited_by)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': total,
+        'skipped': skipped,
+        'unlinked_duplicates': unlinked,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(total / elapsed) if elapsed > 0 else total,
+    }
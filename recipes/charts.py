@@ -0,0 +1,83 @@
+import math
+import time
+
+from django.core.cache import cache
+
+# Same slices and colours the Chart.js version used
+PIE_SLICES = [
+    ('Protein', 'protein_percent', 'rgba(54, 162, 235, 0.7)'),
+    ('Fat', 'fat_percent', 'rgba(255, 206, 86, 0.7)'),
+    ('Carbs', 'carbs_percent', 'rgba(75, 192, 192, 0.7)'),
+    ('Fiber', 'fiber_percent', 'rgba(153, 102, 255, 0.7)'),
+    ('Calories', 'calories_percent', 'rgba(255, 159, 64, 0.7)'),
+]
+
+CHART_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def favorites_version(user_id):
+    """
+    Current favorites version for a user, used to key the cached chart.
+
+    Versions are timestamps rather than counters so an evicted version key
+    never comes back as a value an old chart was cached under.
+    """
+    key = f"favorites_version_{user_id}"
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.set(key, version, None)
+    return version
+
+
+def bump_favorites_version(user_id):
+    cache.set(f"favorites_version_{user_id}", time.time_ns(), None)
+
+
+def _point(cx, cy, r, fraction):
+    angle = 2 * math.pi * fraction - math.pi / 2
+    return cx + r * math.cos(angle), cy + r * math.sin(angle)
+
+
+def nutrition_pie_svg(total_nutrition, size=220):
+    """Render the favorites macronutrient pie chart as a standalone SVG document"""
+    r = size / 2 - 10
+    cx = cy = size / 2
+    values = [(label, float(total_nutrition.get(key, 0) or 0), color) for label, key, color in PIE_SLICES]
+    total = sum(value for _, value, _ in values)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size + 140}" height="{size}" '
+        f'viewBox="0 0 {size + 140} {size}" role="img" aria-label="Total nutrition breakdown">'
+    ]
+
+    start = 0.0
+    for label, value, color in values:
+        if total <= 0 or value <= 0:
+            continue
+        fraction = value / total
+        title = f'<title>{label}: {value:g}%</title>'
+        if fraction >= 0.9999:
+            parts.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="{color}" stroke="#fff">{title}</circle>')
+        else:
+            x1, y1 = _point(cx, cy, r, start)
+            x2, y2 = _point(cx, cy, r, start + fraction)
+            large_arc = 1 if fraction > 0.5 else 0
+            parts.append(
+                f'<path d="M{cx:.2f},{cy:.2f} L{x1:.2f},{y1:.2f} A{r:.2f},{r:.2f} 0 {large_arc} 1 {x2:.2f},{y2:.2f} Z" '
+                f'fill="{color}" stroke="#fff">{title}</path>'
+            )
+        start += fraction
+
+    if total <= 0:
+        parts.append(f'<circle cx="{cx}" cy="{cy}" r="{r}" fill="#e9ecef"><title>No nutrition data</title></circle>')
+
+    for i, (label, value, color) in enumerate(values):
+        y = 20 + i * 24
+        parts.append(f'<rect x="{size + 10}" y="{y - 11}" width="14" height="14" fill="{color}"/>')
+        parts.append(
+            f'<text x="{size + 30}" y="{y}" font-family="sans-serif" font-size="13">{label} {value:g}%</text>'
+        )
+
+    parts.append('</svg>')
+    return ''.join(parts)
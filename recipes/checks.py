@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# Cache backends whose data is private to one process
+PER_PROCESS_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+SHARED_CACHE_HINT = "Set REDIS_URL (or configure another shared cache backend)."
+
+
+def per_process_cache():
+    return settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES
+
+
+@register(Tags.caches, deploy=True)
+def check_rate_limit_cache(app_configs, **kwargs):
+    """
+    Fail `check --deploy` when rate limits can't hold across workers.
+
+    With a per-process cache each worker keeps its own buckets, so N
+    workers admit N times the configured limits. Only a deploy check: the
+    default single-process development setup is fine as it is.
+    """
+    if not settings.RATE_LIMIT_ENABLED or not per_process_cache():
+        return []
+    return [Error(
+        "RATE_LIMITS are enforced per process: the default cache is not shared between workers.",
+        hint=SHARED_CACHE_HINT + " A single-process deployment can silence this.",
+        id='recipes.E001',
+    )]
+
+
+@register(Tags.caches, deploy=True)
+def check_breaker_cache(app_configs, **kwargs):
+    """
+    Circuit breaker state is only shared between workers in a shared cache.
+
+    Per process, every worker has to see failure_threshold failures before
+    it stops calling a dead service and sends its own half-open probe. A
+    warning under `check --deploy` only, like recipes.E001.
+    """
+    if not per_process_cache():
+        return []
+    return [Warning(
+        "Circuit breakers (e.g. USDA lookups) trip per process: the default cache is not shared between workers.",
+        hint=SHARED_CACHE_HINT,
+        id='recipes.W002',
+    )]
@@ -0,0 +1,176 @@
+import hashlib
+import random
+import threading
+import time
+from collections import defaultdict
+
+from .food_index import tokenize
+
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard usually share a bucket
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Estimated Jaccard similarity at or above which two recipes are duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+# How often (seconds) a worker pulls signatures saved or deleted by other processes
+REFRESH_INTERVAL = 30
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def recipe_shingles(title, ingredients):
+    """
+    Normalized feature set for a recipe.
+
+    Each ingredient line becomes its food words (quantities, units and
+    prep words dropped) and the title contributes its words, so the same
+    recipe syndicated with different formatting maps to the same set.
+    """
+    shingles = {'t:' + token for token in tokenize(title or '')}
+    for line in ingredients or []:
+        tokens = tokenize(line)
+        if tokens:
+            shingles.add('i:' + ' '.join(sorted(tokens)))
+    return shingles
+
+
+def _hash(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash_signature(title, ingredients):
+    """MinHash signature (list of NUM_PERM ints) for a recipe, or [] if it has no features"""
+    hashes = [_hash(shingle) for shingle in recipe_shingles(title, ingredients)]
+    if not hashes:
+        return []
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def estimated_similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def _bands(signature):
+    for band in range(BANDS):
+        yield band, tuple(signature[band * ROWS:(band + 1) * ROWS])
+
+
+class LSHIndex:
+    """
+    Banded locality-sensitive hash index over recipe MinHash signatures.
+
+    A query only compares against recipes sharing at least one band bucket,
+    so lookup cost depends on the number of near matches rather than the
+    size of the catalog.
+    """
+
+    def __init__(self):
+        self.signatures = {}
+        self.buckets = defaultdict(set)
+        self.synced_to = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, recipe_id, signature):
+        with self.lock:
+            self._discard(recipe_id)
+            if len(signature) != NUM_PERM:
+                return
+            self.signatures[recipe_id] = signature
+            for key in _bands(signature):
+                self.buckets[key].add(recipe_id)
+
+    def remove(self, recipe_id):
+        with self.lock:
+            self._discard(recipe_id)
+
+    def _discard(self, recipe_id):
+        signature = self.signatures.pop(recipe_id, None)
+        if signature is None:
+            return
+        for key in _bands(signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.discard(recipe_id)
+                if not bucket:
+                    del self.buckets[key]
+
+    def refresh(self):
+        """Apply signatures saved or deleted since the last refresh (see RecipeIndex.refresh)"""
+        from .models import Recipe
+        from .similarity import SYNC_OVERLAP
+
+        recipes = Recipe.objects.exclude(minhash=[])
+        changed = recipes
+        if self.synced_to is not None:
+            changed = recipes.filter(updated_at__gte=self.synced_to - SYNC_OVERLAP)
+        rows = list(changed.values_list('id', 'minhash', 'updated_at'))
+        count = recipes.count()
+
+        for recipe_id, signature, updated_at in rows:
+            self.add(recipe_id, signature)
+            if self.synced_to is None or updated_at > self.synced_to:
+                self.synced_to = updated_at
+        with self.lock:
+            stale = count != len(self.signatures)
+        if stale:
+            ids = set(recipes.values_list('id', flat=True))
+            with self.lock:
+                for recipe_id in [key for key in self.signatures if key not in ids]:
+                    self._discard(recipe_id)
+        with self.lock:
+            self.loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > REFRESH_INTERVAL:
+            self.refresh()
+
+    def query(self, signature, threshold=DUPLICATE_THRESHOLD):
+        """Return [(similarity, recipe_id)] for candidates at or above threshold, best first"""
+        if len(signature) != NUM_PERM:
+            return []
+        with self.lock:
+            candidates = set()
+            for key in _bands(signature):
+                candidates |= self.buckets.get(key, set())
+            matches = []
+            for recipe_id in candidates:
+                similarity = estimated_similarity(signature, self.signatures[recipe_id])
+                if similarity >= threshold:
+                    matches.append((similarity, recipe_id))
+        matches.sort(key=lambda item: (-item[0], item[1]))
+        return matches
+
+
+lsh_index = LSHIndex()
+
+
+def find_duplicate(signature, exclude_url=None):
+    """
+    Return (recipe, similarity) for the closest stored near-duplicate, or (None, 0.0).
+
+    A match that is itself flagged as a duplicate resolves to its canonical
+    recipe. Matches stored under exclude_url (the URL being ingested), or
+    resolving to it, don't count, so a recipe is never its own duplicate.
+    """
+    from .models import Recipe
+
+    lsh_index.ensure_fresh()
+    for similarity, recipe_id in lsh_index.query(signature):
+        recipe = Recipe.objects.filter(id=recipe_id).select_related('duplicate_of').first()
+        if recipe is None:
+            continue
+        canonical = recipe.duplicate_of or recipe
+        if exclude_url and exclude_url in (recipe.source_url, canonical.source_url):
+            continue
+        return canonical, similarity
+    return None, 0.0
@@ -0,0 +1,127 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 'inline' parses in the calling thread, 'process' in a shared process pool (the
+# incremental PageWatcher in scraper.fetch_page stays in the calling thread)
+PARSE_EXECUTOR = os.getenv('SCRAPER_PARSE_EXECUTOR', 'inline')
+PARSE_WORKERS = int(os.getenv('SCRAPER_PARSE_WORKERS', os.cpu_count() or 2))
+# Seconds a caller waits for a free slot, and then for its result
+PARSE_TIMEOUT = float(os.getenv('SCRAPER_PARSE_TIMEOUT', 10))
+
+
+class ExecutorBusy(Exception):
+    """Every slot stayed taken for the whole timeout"""
+
+
+def _noop():
+    return os.getpid()
+
+
+class InlineExecutor:
+    """Runs tasks directly in the calling thread"""
+
+    def run(self, fn, *args):
+        return fn(*args)
+
+    def shutdown(self):
+        pass
+
+
+class ProcessExecutor:
+    """
+    Warm process pool for CPU-bound tasks, shared by every thread in the process.
+
+    At most max_pending tasks are queued or running; run() waits up to
+    timeout seconds for a slot (raising ExecutorBusy) and again for the
+    result (raising TimeoutError). A timed-out task keeps its slot until
+    the worker actually finishes, so slow pages throttle new submissions
+    rather than piling up. Task functions and arguments must be picklable:
+    pass raw bytes and small values, not parsed trees.
+    """
+
+    def __init__(self, workers=PARSE_WORKERS, max_pending=None, timeout=PARSE_TIMEOUT, max_tasks_per_child=500):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        self.slots = threading.BoundedSemaphore(max_pending or workers * 2)
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def _get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                # Never fork a threaded server process
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self.pool = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context(method),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+                # Start every worker now rather than on the first real tasks
+                for future in [self.pool.submit(_noop) for _ in range(self.workers)]:
+                    future.result()
+            return self.pool
+
+    def warm(self):
+        self._get_pool()
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise ExecutorBusy(f"No free parse worker within {self.timeout}s")
+        try:
+            pool = self._get_pool()
+        except BaseException:
+            self.slots.release()
+            raise
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self.slots.release()
+            self._discard(pool)
+            # A worker died; answer this call inline while the pool restarts
+            return fn(*args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except BrokenProcessPool:
+            self._discard(pool)
+            return fn(*args)
+
+    def _discard(self, pool):
+        with self.lock:
+            if self.pool is pool:
+                self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+_parse_executor = None
+_parse_executor_lock = threading.Lock()
+
+
+def get_parse_executor():
+    """The process-wide executor for page parsing, built from SCRAPER_PARSE_EXECUTOR on first use"""
+    global _parse_executor
+    with _parse_executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ProcessExecutor() if PARSE_EXECUTOR == 'process' else InlineExecutor()
+        return _parse_executor
+
+
+def set_parse_executor(executor):
+    """Swap the parse executor (e.g. a larger pool for a batch command); returns the previous one"""
+    global _parse_executor
+    with _parse_executor_lock:
+        previous, _parse_executor = _parse_executor, executor
+    return previous
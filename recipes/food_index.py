@@ -0,0 +1,184 @@
+import csv
+import json
+import re
+from collections import defaultdict
+
+TOKEN_RE = re.compile(r'[a-z]+')
+# Separators between foods in one line ("salt and pepper", "milk (or water)")
+CLAUSE_RE = re.compile(r'[,;:()/]|\b(?:and|or|with)\b')
+
+# Words that say how much or how it is prepared, not what the food is
+STOP_WORDS = {
+    'cup', 'cups', 'tbsp', 'tsp', 'g', 'gram', 'grams', 'kg', 'ml', 'l', 'oz', 'ounce', 'ounces',
+    'lb', 'lbs', 'pound', 'pounds', 'teaspoon', 'teaspoons', 'tablespoon', 'tablespoons',
+    'pinch', 'dash', 'of', 'and', 'or', 'a', 'an', 'the', 'to', 'for', 'taste', 'about',
+    'fresh', 'dried', 'ground', 'chopped', 'sliced', 'minced', 'diced', 'large', 'small',
+    'medium', 'finely', 'roughly', 'softened', 'melted', 'optional',
+}
+
+# Foods whose names contain a more common food's name but are something
+# else ('peanut butter' is not butter, 'sugar snap peas' not sugar). A line
+# naming one of these, or a longer food from the index itself, does not
+# match the shorter food
+OTHER_FOODS = [
+    'peanut butter', 'almond butter', 'cashew butter', 'apple butter', 'cocoa butter', 'butter bean',
+    'butternut squash', 'coconut milk', 'condensed milk', 'evaporated milk', 'milk chocolate',
+    'coconut water', 'rose water', 'sugar snap pea', 'egg noodle', 'egg roll wrapper',
+    'flour tortilla', 'salt pork', 'oil spray',
+]
+
+NUTRIENT_FIELDS = ('calories', 'protein', 'fat', 'carbs', 'fiber')
+
+
+def normalize_token(token):
+    """Reduce simple English plurals so 'tomatoes' and 'tomato' share a token"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('oes'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into normalized food tokens, dropping units and descriptors"""
+    return [normalize_token(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def trigrams(token):
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def load_foods(path):
+    """Load a name -> nutrition profile table from a JSON or CSV file"""
+    if str(path).endswith('.csv'):
+        foods = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                foods[row['name'].strip().lower()] = {
+                    field: float(row.get(field) or 0) for field in NUTRIENT_FIELDS
+                }
+        return foods
+
+    with open(path, encoding='utf-8') as f:
+        return {name.lower(): profile for name, profile in json.load(f).items()}
+
+
+class FoodIndex:
+    """
+    Token and character-trigram index over food names.
+
+    Candidates come from the token postings of the query, so a lookup only
+    touches foods sharing a word with it. Query words that are not in the
+    vocabulary (typos, odd spellings) are mapped to the closest known word
+    by trigram similarity before lookup.
+    """
+
+    def __init__(self, foods, min_similarity=0.5, min_coverage=1.0, other_foods=OTHER_FOODS):
+        self.foods = foods
+        self.min_similarity = min_similarity
+        self.min_coverage = min_coverage
+        self._name_tokens = {}
+        # First word -> multi-word names starting with it, for spotting them in a line
+        self._compounds = defaultdict(set)
+        for name in [*foods, *other_foods]:
+            tokens = tuple(tokenize(name))
+            if len(tokens) > 1:
+                self._compounds[tokens[0]].add(tokens)
+        self._postings = defaultdict(set)
+        self._gram_postings = defaultdict(set)
+        self._gram_counts = {}
+
+        for name in foods:
+            tokens = frozenset(tokenize(name))
+            if not tokens:
+                continue
+            self._name_tokens[name] = tokens
+            for token in tokens:
+                self._postings[token].add(name)
+
+        for token in self._postings:
+            grams = trigrams(token)
+            self._gram_counts[token] = len(grams)
+            for gram in grams:
+                self._gram_postings[gram].add(token)
+
+    def __len__(self):
+        return len(self.foods)
+
+    def _resolve_token(self, token):
+        """Return (vocabulary token, similarity) for a query token, or None"""
+        if token in self._postings:
+            return token, 1.0
+
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self._gram_postings.get(gram, ()):
+                shared[candidate] += 1
+
+        best = None
+        for candidate, count in shared.items():
+            similarity = count / (len(grams) + self._gram_counts[candidate] - count)
+            if similarity >= self.min_similarity and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        return best
+
+    def search(self, query, limit=5):
+        """
+        Rank foods against a free-text ingredient line.
+
+        A food only matches when the line covers every word of its name (so
+        "1 cup almonds" is not 'almond milk'), and not when those words are
+        part of a longer food name in the line (so "peanut butter" is not
+        'butter', while "unsalted butter" is). Among matches, more matched
+        words win (so 'almond milk' beats 'milk' for "1 cup almond milk").
+        Returns a list of (score, name) pairs, best first.
+        """
+        query_lower = query.lower().strip()
+        if query_lower in self.foods:
+            return [((1.0, float('inf')), query_lower)]
+
+        weights = {}
+        # word -> token sets of the longer food names it was part of
+        within = defaultdict(set)
+        for clause in CLAUSE_RE.split(query_lower):
+            tokens = tokenize(clause)
+            words = []
+            for token in tokens:
+                resolved = self._resolve_token(token)
+                word = resolved[0] if resolved else token
+                if resolved and resolved[1] > weights.get(word, 0):
+                    weights[word] = resolved[1]
+                words.append(word)
+            for start, token in enumerate(tokens):
+                for compound in self._compounds.get(token, ()):
+                    if tuple(tokens[start:start + len(compound)]) == compound:
+                        for word in words[start:start + len(compound)]:
+                            within[word].add(frozenset(compound))
+
+        matched = defaultdict(list)
+        for token, weight in weights.items():
+            for name in self._postings[token]:
+                matched[name].append(token)
+
+        ranked = []
+        for name, tokens in matched.items():
+            name_tokens = self._name_tokens[name]
+            coverage = len(tokens) / len(name_tokens)
+            if coverage < self.min_coverage:
+                continue
+            if any(compound > name_tokens for token in tokens for compound in within[token]):
+                # The line names a longer food containing this one
+                continue
+            ranked.append(((coverage, sum(weights[token] for token in tokens)), name))
+
+        ranked.sort(key=lambda item: (-item[0][0], -item[0][1], len(item[1]), item[1]))
+        return ranked[:limit]
+
+    def match(self, query):
+        """Return the best matching food name for a query, or None"""
+        ranked = self.search(query, limit=1)
+        return ranked[0][1] if ranked else None
@@ -0,0 +1,435 @@
+"""
+End-to-end load test support: stub origins, the app server launcher and
+the traffic driver used by `manage.py loadtest`.
+
+Run as `python -m recipes.loadtest setup|serve` it is also the child
+process that prepares the scratch database and serves the app, so nothing
+here imports models at module level.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import requests
+
+INGREDIENT_LINES = [
+    '2 cups all-purpose flour', '1 cup sugar', '3 eggs', '1 cup milk', '100g butter',
+    '2 tbsp olive oil', '1 onion, chopped', '2 cloves garlic', '400g chicken breast',
+    '1 cup rice', '200g paneer', '1 tsp salt', '2 tomatoes, diced', '1 cup yogurt',
+    '250g pasta', '1 tbsp honey', '2 potatoes, cubed', '1 cup spinach', '50g cheese',
+    '1 cup coconut milk',
+]
+
+NUTRIENT_NAMES = [
+    ('Energy', 50, 400), ('Protein', 0, 30), ('Total lipid (fat)', 0, 40),
+    ('Carbohydrate, by difference', 0, 80), ('Fiber, total', 0, 10),
+]
+
+# Relative weight of each virtual-user action
+DEFAULT_MIX = {'submit': 2, 'favorite': 3, 'toggle': 1}
+
+# Only a rendered recipe has its title heading; only logged-in users get the favorite button
+RECIPE_OK_RE = re.compile(r'id="recipe-title"')
+RECIPE_ID_RE = re.compile(r'data-recipe-id="(\d+)"')
+LOADTEST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+# Hosts the stub recipe pages are served under, each laid out for the
+# extractor that host is registered with. Unknown hosts exercise the
+# JSON-LD path and the generic fallback
+STUB_SITES = [
+    ('www.bbcgoodfood.com', 'bbcgoodfood'),
+    ('www.allrecipes.com', 'allrecipes'),
+    ('www.simplyrecipes.com', 'simplyrecipes'),
+    ('www.recipetineats.com', 'common'),
+    ('www.vegrecipesofindia.com', 'common'),
+    ('www.seriouseats.com', 'jsonld'),
+    ('www.stub-kitchen.test', 'generic'),
+]
+STUB_LAYOUTS = dict(STUB_SITES)
+
+
+def stub_recipe_url(number):
+    """URL of stub recipe <number>; consecutive numbers go to different sites"""
+    host, _ = STUB_SITES[number % len(STUB_SITES)]
+    return f"http://{host}/recipes/{number}"
+
+
+def _items(tag, texts, attrs=''):
+    return ''.join(f"<{tag}{attrs}>{text}</{tag}>" for text in texts)
+
+
+def stub_recipe_page(number, layout='common'):
+    """Deterministic recipe page for /recipes/<number>, marked up the way layout's sites do"""
+    rng = random.Random(number)
+    lines = rng.sample(INGREDIENT_LINES, rng.randint(5, 12))
+    steps = [f"Step {i + 1}: combine the {line.split()[-1]} and cook gently for a few minutes."
+             for i, line in enumerate(lines[:6])]
+    title = f"Stub Recipe {number}"
+    if layout == 'bbcgoodfood':
+        ingredients = _items('li', lines, ' class="ingredients-list__item"')
+        method = _items('li', [f'<p>{step}</p>' for step in steps], ' class="method-steps__list-item"')
+        body = (
+            f'<h1 class="heading__title">{title}</h1>'
+            f'<section class="recipe__ingredients"><ul>{ingredients}</ul></section>'
+            f'<section class="recipe__method-steps"><ul>{method}</ul></section>'
+        )
+    elif layout == 'allrecipes':
+        ingredients = _items('li', [f'<span class="ingredients-item-name">{line}</span>' for line in lines])
+        method = _items('div', [f'<p>{step}</p>' for step in steps], ' class="paragraph"')
+        body = f'<h1 class="recipe-title">{title}</h1><ul>{ingredients}</ul>{method}'
+    elif layout == 'simplyrecipes':
+        body = (
+            f'<h1 class="heading__title">{title}</h1>'
+            f'<div class="structured-ingredients"><ul>{_items("li", lines)}</ul></div>'
+            f'<div id="structured-project__steps_1-0">{_items("p", steps)}</div>'
+        )
+    elif layout == 'jsonld':
+        recipe_ld = {
+            '@context': 'https://schema.org', '@type': 'Recipe', 'name': title,
+            'recipeIngredient': lines,
+            'recipeInstructions': [{'@type': 'HowToStep', 'text': step} for step in steps],
+        }
+        body = (
+            f'<script type="application/ld+json">{json.dumps(recipe_ld)}</script>'
+            f'<h1>{title}</h1><ul>{_items("li", lines)}</ul>{_items("p", steps)}'
+        )
+    elif layout == 'generic':
+        body = f'<h1>{title}</h1><ul>{_items("li", lines)}</ul>{_items("p", steps)}'
+    else:
+        body = (
+            f'<h1 class="entry-title">{title}</h1>'
+            f'<div class="wprm-recipe-ingredients"><ul>{_items("li", lines)}</ul></div>'
+            f'<ol class="wprm-recipe-instructions">{_items("li", steps)}</ol>'
+        )
+    return f'<html><head><title>{title}</title></head><body>{body}</body></html>'
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler_class, latency=0.0, failure_rate=0.0):
+        super().__init__(('127.0.0.1', 0), handler_class)
+        self.latency = latency
+        self.failure_rate = failure_rate
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Adds the server's latency, fails a share of requests with 503, otherwise calls respond()"""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if random.random() < self.server.failure_rate:
+            self.send_body(503, 'text/plain', 'stub failure')
+            return
+        self.respond(urlsplit(self.path).path)
+
+    def send_body(self, status, content_type, body):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RecipeSiteHandler(StubHandler):
+    """
+    Every STUB_SITES host at once.
+
+    The app server reaches it as its HTTP proxy (see child_env), so the
+    Host header names the site a page is laid out for.
+    """
+
+    def respond(self, path):
+        layout = STUB_LAYOUTS.get((self.headers.get('Host') or '').split(':')[0].lower())
+        match = re.fullmatch(r'/recipes/(\d+)', path)
+        if not layout or not match:
+            self.send_body(404, 'text/plain', 'not found')
+            return
+        self.send_body(200, 'text/html; charset=utf-8', stub_recipe_page(int(match.group(1)), layout))
+
+
+class USDAHandler(StubHandler):
+    """Answers the two FoodData Central endpoints nutrition.py calls"""
+
+    def respond(self, path):
+        if path.endswith('/foods/search'):
+            fdc_id = int(hashlib.md5(self.path.encode()).hexdigest()[:6], 16)
+            self.send_body(200, 'application/json', json.dumps({'foods': [{'fdcId': fdc_id}]}))
+        elif '/food/' in path:
+            rng = random.Random(path)
+            nutrients = [{'nutrientName': name, 'value': round(rng.uniform(low, high), 1)}
+                         for name, low, high in NUTRIENT_NAMES]
+            self.send_body(200, 'application/json', json.dumps({'foodNutrients': nutrients}))
+        else:
+            self.send_body(404, 'text/plain', 'not found')
+
+
+def start_stub(handler_class, latency=0.0, failure_rate=0.0):
+    server = StubServer(handler_class, latency, failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(server, port, workers, threads):
+    """Command line that serves the app on port with the chosen server"""
+    bind = f"127.0.0.1:{port}"
+    if server == 'gunicorn':
+        return ['gunicorn', 'food_optimizer.wsgi:application', '-b', bind,
+                '-w', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    if server == 'uvicorn':
+        return ['uvicorn', 'food_optimizer.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'recipes.loadtest', 'serve', str(port)]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"App server did not listen on port {port} within {timeout}s")
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class LatencyStats:
+    """Per-route request latencies and error counts, shared by all virtual users"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, elapsed):
+        """{route: {requests, errors, rps, p50_ms, p95_ms, p99_ms, max_ms}}, plus an 'all' row"""
+        with self.lock:
+            routes = {route: sorted(values) for route, values in self.latencies.items()}
+            errors = dict(self.errors)
+        routes['all'] = sorted(value for values in routes.values() for value in values)
+        errors['all'] = sum(errors.values())
+
+        report = {}
+        for route, values in routes.items():
+            report[route] = {
+                'requests': len(values),
+                'errors': errors.get(route, 0),
+                'rps': round(len(values) / elapsed, 1) if elapsed > 0 else 0.0,
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1) if values else 0.0,
+            }
+        return report
+
+
+class VirtualUser:
+    """
+    One simulated browser session.
+
+    Each iteration picks an action by weight: 'submit' posts a stub recipe
+    URL to index and then opens the recipe page it redirects to, 'favorite'
+    opens the favorites page and 'toggle' favorites a recipe this user has
+    seen. Anonymous users only submit.
+    """
+
+    def __init__(self, base_url, recipe_count, stats, mix, session_key=None, think_time=0.0):
+        self.base_url = base_url
+        self.recipe_count = recipe_count
+        self.stats = stats
+        self.think_time = think_time
+        self.logged_in = session_key is not None
+        self.actions = [action for action in mix if self.logged_in or action == 'submit']
+        self.weights = [mix[action] for action in self.actions]
+        self.recipe_ids = []
+        self.http = requests.Session()
+        if session_key:
+            self.http.cookies.set('sessionid', session_key, domain='127.0.0.1', path='/')
+
+    def _request(self, route, method, path, expect=(200,), check=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            resp = self.http.request(method, self.base_url + path, allow_redirects=False, timeout=60, **kwargs)
+            ok = resp.status_code in expect and (check is None or check(resp))
+        except requests.RequestException:
+            resp, ok = None, False
+        self.stats.record(route, time.perf_counter() - started, ok)
+        return resp if ok else None
+
+    def _csrf(self):
+        return {'X-CSRFToken': self.http.cookies.get('csrftoken', '')}
+
+    def submit(self):
+        url = stub_recipe_url(random.randrange(self.recipe_count))
+        restriction = random.choice(['', '', 'vegan', 'healthy'])
+        if self._request('index POST', 'POST', '/', expect=(302,), headers=self._csrf(),
+                         data={'url': url, 'restriction': restriction}):
+            # Pipeline failures still render the recipe page, just without a recipe id
+            resp = self._request('recipe', 'GET', '/recipe/', check=lambda r: RECIPE_OK_RE.search(r.text))
+            match = RECIPE_ID_RE.search(resp.text) if resp is not None else None
+            if match:
+                self.recipe_ids.append(match.group(1))
+
+    def favorite(self):
+        self._request('favorite', 'GET', '/favorite/')
+
+    def toggle(self):
+        if not self.recipe_ids:
+            return self.submit()
+        self._request('toggle-favorite', 'POST', '/toggle-favorite/', headers=self._csrf(),
+                      data={'recipe_id': random.choice(self.recipe_ids)})
+
+    def run(self, deadline):
+        # Picks up the CSRF cookie; not counted
+        self.http.get(self.base_url + '/', timeout=60)
+        while time.monotonic() < deadline:
+            action = random.choices(self.actions, self.weights)[0]
+            getattr(self, action)()
+            if self.think_time:
+                time.sleep(random.uniform(0, 2 * self.think_time))
+
+
+def run_traffic(base_url, recipe_count, session_keys, anonymous, duration, mix, think_time=0.0):
+    """Drive len(session_keys) logged-in plus `anonymous` users for duration seconds; return (stats, elapsed)"""
+    stats = LatencyStats()
+    users = [VirtualUser(base_url, recipe_count, stats, mix, key, think_time) for key in session_keys]
+    users += [VirtualUser(base_url, recipe_count, stats, mix, None, think_time) for _ in range(anonymous)]
+
+    started = time.monotonic()
+    deadline = started + duration
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats, time.monotonic() - started
+
+
+def setup_database(users):
+    """Migrate the scratch database and log in `users` users; prints their session keys as JSON"""
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from django.contrib.sessions.backends.db import SessionStore
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    # Hash once with a fast hasher; nobody ever logs in with this password
+    settings.PASSWORD_HASHERS = LOADTEST_PASSWORD_HASHERS
+    password = make_password('loadtest')
+    User.objects.bulk_create([User(username=f"loadtest{i}", password=password) for i in range(users)])
+
+    session_keys = []
+    for user in User.objects.filter(username__startswith='loadtest').order_by('id'):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        session_keys.append(session.session_key)
+    print(json.dumps(session_keys))
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    """Threaded stdlib WSGI server; the default when gunicorn/uvicorn aren't installed"""
+    from food_optimizer.wsgi import application
+    server = ThreadingWSGIServer(('127.0.0.1', port), QuietHandler)
+    server.set_app(application)
+    server.serve_forever()
+
+
+def child_env(database, usda_url, origin_url=None, rate_limits=False):
+    """
+    Environment for the app processes.
+
+    With origin_url, plain-HTTP fetches go through the stub recipe sites as
+    a proxy, so stub URLs keep their real hostnames (and extractors); the
+    app and the USDA stub on 127.0.0.1 are reached directly.
+    """
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'food_optimizer.settings')
+    env['SQLITE_PATH'] = database
+    env['USDA_BASE_URL'] = usda_url
+    if origin_url:
+        # requests prefers the lowercase names, so set both
+        for name in ('http_proxy', 'HTTP_PROXY'):
+            env[name] = origin_url
+        for name in ('no_proxy', 'NO_PROXY'):
+            env[name] = '127.0.0.1,localhost'
+    # Off by default: a few virtual users would otherwise spend the run on 429s
+    env['RATE_LIMIT_ENABLED'] = '1' if rate_limits else '0'
+    return env
+
+
+def run_setup(database, usda_url, users, cwd):
+    output = subprocess.run(
+        [sys.executable, '-m', 'recipes.loadtest', 'setup', str(users)],
+        env=child_env(database, usda_url), cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'food_optimizer.settings')
+    command, argument = sys.argv[1], int(sys.argv[2])
+    if command == 'setup':
+        setup_database(argument)
+    elif command == 'serve':
+        serve(argument)
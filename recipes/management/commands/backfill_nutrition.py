@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.nutrition import analyze_nutrition
+
+
+class Command(BaseCommand):
+    help = ("Compute and store nutrition for recipes saved without it (rows from before nutrition "
+            "was stored at ingestion); favorites pages skip such rows until then")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help="At most this many recipes per run")
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.filter(nutrition={}).exclude(ingredients=[]).order_by('id')
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        count = 0
+        for recipe in queryset.iterator(chunk_size=100):
+            recipe.nutrition = analyze_nutrition(recipe.ingredients)
+            # updated_at too, so other workers' indexes pick the row up
+            recipe.save(update_fields=['nutrition', 'updated_at'])
+            count += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{recipe.source_url or recipe.pk}: {recipe.nutrition['calories']} kcal")
+
+        self.stdout.write(self.style.SUCCESS(f"{count} recipes backfilled"))
@@ -0,0 +1,48 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.bulk import IMPORT_BATCH_SIZE, import_rows, read_csv, read_ndjson, read_parquet
+
+
+class Command(BaseCommand):
+    help = "Import recipes from an export_recipes file, updating rows whose source_url already exists"
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="Input file, '-' for stdin (NDJSON/CSV only)")
+        parser.add_argument('--format', choices=['ndjson', 'csv', 'parquet'],
+                            help="Defaults to the input file's extension, else ndjson")
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help="Rows written per bulk insert")
+
+    def handle(self, *args, **options):
+        path = options['input']
+        fmt = options['format'] or next(
+            (ext for ext in ('csv', 'parquet') if path.endswith('.' + ext)), 'ndjson'
+        )
+
+        if fmt == 'parquet':
+            if path == '-':
+                raise CommandError("Parquet import needs an input file")
+            try:
+                stats = import_rows(read_parquet(path), options['batch_size'])
+            except ImportError as e:
+                raise CommandError(str(e))
+        else:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+            reader = read_csv if fmt == 'csv' else read_ndjson
+            try:
+                stats = import_rows(reader(stream), options['batch_size'])
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['rows']} recipes in {stats['seconds']}s ({stats['rows_per_second']} rows/s)"
+        ))
+        if stats['skipped']:
+            self.stdout.write(self.style.WARNING(f"Skipped {stats['skipped']} rows without a source_url"))
+        if stats['unlinked_duplicates']:
+            self.stdout.write(self.style.WARNING(
+                f"{stats['unlinked_duplicates']} duplicate links point at recipes not in the catalog"
+            ))
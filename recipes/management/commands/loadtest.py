@@ -0,0 +1,104 @@
+import json
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.loadtest import (
+    DEFAULT_MIX, RecipeSiteHandler, USDAHandler, child_env, free_port, run_setup,
+    run_traffic, server_command, start_stub, wait_for_port,
+)
+
+
+def parse_mix(value):
+    """'submit=2,favorite=3,toggle=1' -> dict"""
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action.strip() not in DEFAULT_MIX:
+            raise CommandError(f"Unknown action {action!r}; expected {', '.join(DEFAULT_MIX)}")
+        mix[action.strip()] = float(weight or 1)
+    return mix
+
+
+class Command(BaseCommand):
+    help = ("Load-test the full stack: start stub recipe sites and a stub USDA API, serve the app "
+            "from a scratch database and report throughput and latency percentiles per route")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help="Concurrent logged-in users")
+        parser.add_argument('--anonymous', type=int, default=0, help="Concurrent anonymous users")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of traffic")
+        parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                            help="Action weights, e.g. submit=2,favorite=3,toggle=1")
+        parser.add_argument('--think-time', type=float, default=0.0, help="Mean pause between actions")
+        parser.add_argument('--recipes', type=int, default=500, help="Distinct stub recipe URLs")
+        parser.add_argument('--server', choices=['wsgiref', 'gunicorn', 'uvicorn'], default='wsgiref')
+        parser.add_argument('--workers', type=int, default=2, help="gunicorn/uvicorn worker processes")
+        parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+        parser.add_argument('--origin-latency', type=float, default=0.05)
+        parser.add_argument('--origin-failure-rate', type=float, default=0.0)
+        parser.add_argument('--usda-latency', type=float, default=0.05)
+        parser.add_argument('--usda-failure-rate', type=float, default=0.0)
+        parser.add_argument('--rate-limits', action='store_true',
+                            help="Keep RATE_LIMITS enforced; throttled requests count as errors")
+        parser.add_argument('--json', dest='json_output', help="Also write the report to this file")
+
+    def handle(self, *args, **options):
+        if options['server'] != 'wsgiref' and not shutil.which(options['server']):
+            raise CommandError(f"{options['server']} is not installed")
+
+        origin = start_stub(RecipeSiteHandler, options['origin_latency'], options['origin_failure_rate'])
+        usda = start_stub(USDAHandler, options['usda_latency'], options['usda_failure_rate'])
+        workdir = tempfile.mkdtemp(prefix='loadtest-')
+        database = str(Path(workdir) / 'loadtest.sqlite3')
+        process = None
+        try:
+            self.stderr.write("Preparing scratch database...")
+            session_keys = run_setup(database, usda.base_url, options['users'], settings.BASE_DIR)
+
+            port = free_port()
+            process = subprocess.Popen(
+                server_command(options['server'], port, options['workers'], options['threads']),
+                env=child_env(database, usda.base_url, origin.base_url, options['rate_limits']),
+                cwd=settings.BASE_DIR,
+                # App tracebacks are only interesting when digging into errors
+                stdout=None if options['verbosity'] > 1 else subprocess.DEVNULL,
+                stderr=None if options['verbosity'] > 1 else subprocess.DEVNULL,
+            )
+            wait_for_port(port, process)
+            self.stderr.write(
+                f"Running {options['users']} logged-in + {options['anonymous']} anonymous users "
+                f"for {options['duration']:g}s against {options['server']}..."
+            )
+
+            stats, elapsed = run_traffic(
+                f"http://127.0.0.1:{port}", options['recipes'], session_keys,
+                options['anonymous'], options['duration'], options['mix'], options['think_time'],
+            )
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            raise CommandError(str(e))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+            origin.shutdown()
+            usda.shutdown()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        report = stats.report(elapsed)
+        self.stdout.write(f"{'route':<18}{'requests':>10}{'errors':>8}{'req/s':>9}"
+                          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for route, row in sorted(report.items(), key=lambda item: item[0] == 'all'):
+            self.stdout.write(f"{route:<18}{row['requests']:>10}{row['errors']:>8}{row['rps']:>9}"
+                              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+
+        if options['json_output']:
+            with open(options['json_output'], 'w') as f:
+                json.dump({'options': {k: v for k, v in options.items() if k in (
+                    'users', 'anonymous', 'duration', 'mix', 'server', 'workers', 'threads',
+                    'origin_latency', 'origin_failure_rate', 'usda_latency', 'usda_failure_rate',
+                )}, 'elapsed': round(elapsed, 2), 'routes': report}, f, indent=2)
@@ -0,0 +1,60 @@
+import pickle
+
+from django.contrib.sessions.serializers import JSONSerializer
+from django.core import signing
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.pipeline import run_recipe_pipeline, split_context
+from recipes.serializers import CompactCacheSerializer, CompactSessionSerializer
+
+SESSION_SALT = 'django.contrib.sessions.SessionStore'
+
+
+class Command(BaseCommand):
+    help = ("Submit recipes through the pipeline and compare bytes per cached/session context: "
+            "pickled or JSON full contexts vs content-split cache entries and packed sessions")
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', help="Recipe URLs to submit (default: recently stored ones)")
+        parser.add_argument('--limit', type=int, default=50, help="Stored recipes to submit when no URLs are given")
+        parser.add_argument('--restrictions', default=',vegan,healthy',
+                            help="Comma-separated restrictions to submit each URL with; empty means none")
+
+    def handle(self, *args, **options):
+        urls = options['urls'] or list(
+            Recipe.objects.exclude(source_url=None).order_by('-id')
+            .values_list('source_url', flat=True)[:options['limit']]
+        )
+        contexts = []
+        for url in urls:
+            for restriction in options['restrictions'].split(','):
+                context = run_recipe_pipeline(url, restriction)
+                if context and context.get('success'):
+                    contexts.append(context)
+        if not contexts:
+            self.stdout.write("No successful submissions to measure")
+            return
+
+        cache_serializer = CompactCacheSerializer()
+        sizes = {'cache_before': 0, 'cache_after': 0, 'session_before': 0, 'session_after': 0}
+        # Blobs are stored once however many entries share them
+        blobs = {}
+        for context in contexts:
+            compact, context_blobs = split_context(context)
+            blobs.update(context_blobs)
+            sizes['cache_before'] += len(pickle.dumps(context, pickle.HIGHEST_PROTOCOL))
+            sizes['cache_after'] += len(cache_serializer.dumps(compact))
+            sizes['session_before'] += len(signing.dumps(
+                {'recipe_context': context}, salt=SESSION_SALT, serializer=JSONSerializer, compress=True))
+            sizes['session_after'] += len(signing.dumps(
+                {'recipe_context': context}, salt=SESSION_SALT, serializer=CompactSessionSerializer, compress=True))
+        sizes['cache_after'] += sum(len(cache_serializer.dumps(value)) for value in blobs.values())
+
+        count = len(contexts)
+        for kind in ('cache', 'session'):
+            before, after = sizes[f'{kind}_before'] / count, sizes[f'{kind}_after'] / count
+            self.stdout.write(
+                f"{kind:<8} {before:>8.0f} -> {after:>6.0f} bytes per entry ({after / before:.0%}) "
+                f"over {count} submissions of {len(urls)} recipes"
+            )
@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from recipes.executors import ProcessExecutor, set_parse_executor
+from recipes.models import Recipe
+from recipes.pipeline import refresh_recipe
+
+
+class Command(BaseCommand):
+    help = ("Re-scrape stored recipes not fetched recently (meant for cron). Fetches are conditional "
+            "on the stored ETag/Last-Modified and only changed ingredient lines get new nutrition lookups")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-hours', type=float, default=24,
+                            help="Only recipes last fetched longer ago than this")
+        parser.add_argument('--limit', type=int, help="At most this many recipes per run")
+        parser.add_argument('--force', action='store_true',
+                            help="Ignore stored validators and fetch every page")
+        parser.add_argument('--concurrency', type=int, default=1, help="Recipes fetched at once")
+        parser.add_argument('--parse-workers', type=int, default=0,
+                            help="Parse pages in this many worker processes (default: SCRAPER_PARSE_EXECUTOR)")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['stale_hours'])
+        queryset = (Recipe.objects.exclude(source_url=None)
+                    .filter(Q(fetched_at__isnull=True) | Q(fetched_at__lt=cutoff))
+                    .order_by(F('fetched_at').asc(nulls_first=True)))
+        if options['limit']:
+            queryset = queryset[:options['limit']]
+
+        counts = {'not_modified': 0, 'unchanged': 0, 'updated': 0, 'failed': 0}
+        changed_lines = 0
+        previous = None
+        if options['parse_workers']:
+            parse_executor = ProcessExecutor(workers=options['parse_workers'])
+            parse_executor.warm()
+            previous = set_parse_executor(parse_executor)
+        try:
+            recipes = queryset.iterator(chunk_size=100)
+            with ThreadPoolExecutor(options['concurrency']) as threads:
+                while True:
+                    batch = list(islice(recipes, options['concurrency'] * 4))
+                    if not batch:
+                        break
+                    for recipe, result in zip(batch, threads.map(lambda r: self.refresh(r, options['force']), batch)):
+                        if isinstance(result, Exception):
+                            counts['failed'] += 1
+                            self.stderr.write(f"{recipe.source_url}: {result}")
+                            continue
+                        status, changed = result
+                        counts[status] += 1
+                        changed_lines += len(changed)
+                        if options['verbosity'] > 1:
+                            self.stdout.write(f"{recipe.source_url}: {status} ({len(changed)} lines changed)")
+        finally:
+            if options['parse_workers']:
+                set_parse_executor(previous).shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['updated']} updated ({changed_lines} lines re-analyzed), {counts['unchanged']} unchanged, "
+            f"{counts['not_modified']} not modified, {counts['failed']} failed"
+        ))
+
+    def refresh(self, recipe, force):
+        """refresh_recipe for one worker thread; errors are returned rather than raised"""
+        close_old_connections()
+        try:
+            return refresh_recipe(recipe, force)
+        except Exception as e:
+            return e
+        finally:
+            close_old_connections()
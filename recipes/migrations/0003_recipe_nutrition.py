@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_recipe_ingredients_delete_ingredient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='nutrition',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:16
+
+import hashlib
+import random
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copies of recipes.food_index.tokenize and recipes.dedup.minhash_signature
+# as they were when this migration was written, so later changes to the app code
+# can't break or alter the backfill
+
+TOKEN_RE = re.compile(r'[a-z]+')
+STOP_WORDS = {
+    'cup', 'cups', 'tbsp', 'tsp', 'g', 'gram', 'grams', 'kg', 'ml', 'l', 'oz', 'ounce', 'ounces',
+    'lb', 'lbs', 'pound', 'pounds', 'teaspoon', 'teaspoons', 'tablespoon', 'tablespoons',
+    'pinch', 'dash', 'of', 'and', 'or', 'a', 'an', 'the', 'to', 'for', 'taste', 'about',
+    'fresh', 'dried', 'ground', 'chopped', 'sliced', 'minced', 'diced', 'large', 'small',
+    'medium', 'finely', 'roughly', 'softened', 'melted', 'optional',
+}
+NUM_PERM = 64
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize_token(token):
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('oes'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [normalize_token(t) for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def minhash_signature(title, ingredients):
+    shingles = {'t:' + token for token in tokenize(title or '')}
+    for line in ingredients or []:
+        tokens = tokenize(line)
+        if tokens:
+            shingles.add('i:' + ' '.join(sorted(tokens)))
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+              for shingle in shingles]
+    if not hashes:
+        return []
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def backfill_minhash(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for recipe in Recipe.objects.only('id', 'title', 'ingredients').iterator(chunk_size=500):
+        recipe.minhash = minhash_signature(recipe.title, recipe.ingredients)
+        recipe.save(update_fields=['minhash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_nutrition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='recipes.recipe'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='minhash',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.RunPython(backfill_minhash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='rules_version',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
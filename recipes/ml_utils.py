@@ -29,6 +29,41 @@ SUBSTITUTIONS = {
     }
 }
 
+def substitute_egg(ing):
+    """Replace an egg line with flaxseed meal, scaling by the egg count"""
+    # Try to find a number for quantity, default to 1 if not found
+    quantity_match = re.search(r'(\d*\.?\d+)', ing)
+    quantity = 1.0
+    if quantity_match:
+        try:
+            quantity = float(quantity_match.group(1))
+        except ValueError:
+            pass  # Keep default quantity of 1 if parsing fails
+
+    # Conversion rule: 1 egg is substituted with 10 grams of flaxseed meal
+    flax_quantity = quantity * 50
+    return f"{flax_quantity:.0f}g flaxseed meal"
+
+def substitution_candidates(ing):
+    """
+    List every substitution the rules allow for one ingredient line.
+
+    Returns (restriction, key, new_line) tuples, one per alternative, so
+    'tofu or seitan' yields a tofu line and a seitan line.
+    """
+    candidates = []
+    ing_lower = ing.lower()
+    for restriction, subs in SUBSTITUTIONS.items():
+        for key, val in subs.items():
+            if key not in ing_lower:
+                continue
+            if restriction == 'vegan' and key == 'egg':
+                candidates.append((restriction, key, substitute_egg(ing)))
+                continue
+            for alternative in val.split(' or '):
+                candidates.append((restriction, key, ing_lower.replace(key, alternative)))
+    return candidates
+
 def modify_ingredients(ingredients, restriction):
     if restriction not in SUBSTITUTIONS:
         return ingredients
@@ -39,18 +74,7 @@ def modify_ingredients(ingredients, restriction):
     for ing in ingredients:
         # Special case for vegan egg substitution with unit conversion
         if restriction == 'vegan' and 'egg' in ing.lower():
-            # Try to find a number for quantity, default to 1 if not found
-            quantity_match = re.search(r'(\d*\.?\d+)', ing)
-            quantity = 1.0
-            if quantity_match:
-                try:
-                    quantity = float(quantity_match.group(1))
-                except ValueError:
-                    pass  # Keep default quantity of 1 if parsing fails
-            
-            # Conversion rule: 1 egg is substituted with 10 grams of flaxseed meal
-            flax_quantity = quantity * 50
-            modified_list.append(f"{flax_quantity:.0f}g flaxseed meal")
+            modified_list.append(substitute_egg(ing))
             continue  # Move to the next ingredient
 
         # General substitution for all other cases
@@ -8,6 +8,23 @@ class Recipe(models.Model):
     instructions = models.TextField()
     source_url = models.URLField(unique=True, blank=True, null=True)
     ingredients = models.JSONField(default=list)
+    nutrition = models.JSONField(default=dict, blank=True)
+    minhash = models.JSONField(default=list, blank=True)
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates'
+    )
+    # How the stored ingredients were derived, so a re-scrape can redo it
+    restriction = models.CharField(max_length=50, blank=True)
+    targets = models.JSONField(default=dict, blank=True)
+    # HTTP validators from the last fetch, for conditional re-scrapes
+    etag = models.CharField(max_length=200, blank=True)
+    last_modified = models.CharField(max_length=100, blank=True)
+    fetched_at = models.DateTimeField(null=True, blank=True)
+    # nutrition.RULES_VERSION the ingredients were derived under; a re-scrape
+    # under other rules fetches the page even if it hasn't changed
+    rules_version = models.CharField(max_length=50, blank=True)
+    # Lets each worker's in-memory indexes pick up rows changed by other processes
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
@@ -19,13 +36,29 @@ class Recipe(models.Model):
     # formatted_ingredients.short_description = "Ingredients"
 
 
+class LineNutrition(models.Model):
+    """USDA nutrition for one normalized ingredient line, shared by every recipe using it"""
+    fingerprint = models.CharField(max_length=40, unique=True)
+    line = models.TextField()
+    nutrition = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.line
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # Also serves the (user, recipe) lookups in toggle_favorite and recipe_view
         unique_together = ('user', 'recipe')
+        indexes = [
+            # favorite_list and the favorite counts filter by user, newest first
+            models.Index(fields=['user', '-created_at'], name='favorite_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.title}"
@@ -1,6 +1,13 @@
 import requests
+import hashlib
+import json
 import os
 import time
+from functools import lru_cache
+
+from .breaker import CircuitBreaker
+from .food_index import FoodIndex, load_foods
+from .ml_utils import SUBSTITUTIONS
 
 USDA_API_KEY = os.getenv('27m65Xj0sxPMfSg3Zsbd1FmDo4nawgel2vLHnmlq')
 # SEARCH_URL = 'https://api.nal.usda.gov/fdc/v1/foods/search'
@@ -50,26 +57,40 @@ USDA_API_KEY = os.getenv('27m65Xj0sxPMfSg3Zsbd1FmDo4nawgel2vLHnmlq')
 #             total['fat'] += nut['fat']
 #             total['carbs'] += nut['carbs']
 #     return total
-SEARCH_URL = 'https://api.nal.usda.gov/fdc/v1/foods/search'
-DETAIL_URL = 'https://api.nal.usda.gov/fdc/v1/food/'
-
-# Fallback nutrition data for common ingredients
-FALLBACK_NUTRITION = {
-    'milk': {'calories': 42, 'protein': 3.4, 'fat': 1.0, 'carbs': 5.0, 'fiber': 0.0},
-    'flour': {'calories': 364, 'protein': 10.0, 'fat': 1.0, 'carbs': 76.0, 'fiber': 2.7},
-    'egg': {'calories': 68, 'protein': 6.0, 'fat': 5.0, 'carbs': 1.0, 'fiber': 0.0},
-    'butter': {'calories': 102, 'protein': 0.1, 'fat': 12.0, 'carbs': 0.0, 'fiber': 0.0},
-    'sugar': {'calories': 387, 'protein': 0.0, 'fat': 0.0, 'carbs': 100.0, 'fiber': 0.0},
-    'salt': {'calories': 0, 'protein': 0.0, 'fat': 0.0, 'carbs': 0.0, 'fiber': 0.0},
-    'oil': {'calories': 884, 'protein': 0.0, 'fat': 100.0, 'carbs': 0.0, 'fiber': 0.0},
-    'water': {'calories': 0, 'protein': 0.0, 'fat': 0.0, 'carbs': 0.0, 'fiber': 0.0},
-    'almond milk': {'calories': 17, 'protein': 0.6, 'fat': 1.2, 'carbs': 0.3, 'fiber': 0.0},
-    'almond flour': {'calories': 570, 'protein': 21.0, 'fat': 50.0, 'carbs': 21.0, 'fiber': 10.0},
-    'vegan butter': {'calories': 90, 'protein': 0.0, 'fat': 10.0, 'carbs': 0.0, 'fiber': 0.0},
-    'flaxseed meal': {'calories': 37, 'protein': 1.3, 'fat': 3.0, 'carbs': 2.0, 'fiber': 2.8},
-}
-
-def get_fdc_id(ingredient):
+USDA_BASE_URL = os.getenv('USDA_BASE_URL', 'https://api.nal.usda.gov/fdc/v1')
+SEARCH_URL = f'{USDA_BASE_URL}/foods/search'
+DETAIL_URL = f'{USDA_BASE_URL}/food/'
+
+# Fallback nutrition data for common ingredients, loaded once into a fuzzy index
+FALLBACK_NUTRITION_FILE = os.getenv(
+    'FALLBACK_NUTRITION_FILE',
+    os.path.join(os.path.dirname(__file__), 'data', 'fallback_nutrition.json')
+)
+FALLBACK_NUTRITION = load_foods(FALLBACK_NUTRITION_FILE)
+FALLBACK_INDEX = FoodIndex(FALLBACK_NUTRITION)
+FALLBACK_CACHE_SIZE = int(os.getenv('FALLBACK_CACHE_SIZE', 4096))
+
+# Used when nothing in the fallback table matches
+DEFAULT_NUTRITION = {'calories': 50, 'protein': 2.0, 'fat': 1.0, 'carbs': 5.0, 'fiber': 2.0}
+
+# Bump when the way a line maps to nutrition changes; stored line results
+# from other versions (or another fallback table) are then ignored. The
+# substitution rules are hashed in too, so re-scrapes know to re-apply them
+NUTRITION_RULES_VERSION = 1
+RULES_VERSION = '{}-{}'.format(
+    NUTRITION_RULES_VERSION,
+    hashlib.sha1(json.dumps([FALLBACK_NUTRITION, SUBSTITUTIONS], sort_keys=True).encode()).hexdigest()[:8],
+)
+
+# Per-request timeout for USDA calls, and the overall budget for one analyze_nutrition call
+USDA_TIMEOUT = 10
+NUTRITION_DEADLINE = float(os.getenv('NUTRITION_DEADLINE', 8))
+
+# After repeated USDA failures, skip straight to the fallback table (shared across
+# workers only with a shared cache; see recipes.W002)
+USDA_BREAKER = CircuitBreaker('usda', failure_threshold=5, reset_timeout=30)
+
+def get_fdc_id(ingredient, timeout=USDA_TIMEOUT):
     """Get FDC ID for an ingredient from USDA API"""
     try:
         # Clean ingredient name - remove measurements and common words
@@ -82,8 +103,11 @@ def get_fdc_id(ingredient):
             'dataType': ['Foundation', 'SR Legacy']
         }
         
-        resp = requests.get(SEARCH_URL, params=params, timeout=10)
-        if resp.status_code == 200:
+        resp = requests.get(SEARCH_URL, params=params, timeout=timeout)
+        if resp.status_code != 200:
+            USDA_BREAKER.record_failure()
+        else:
+            USDA_BREAKER.record_success()
             data = resp.json()
             foods = data.get('foods', [])
             if foods:
@@ -91,6 +115,7 @@ def get_fdc_id(ingredient):
         
         return None
     except Exception as e:
+        USDA_BREAKER.record_failure()
         print(f"Error getting FDC ID for {ingredient}: {e}")
         return None
 
@@ -109,13 +134,16 @@ def clean_ingredient_name(ingredient):
     
     return ' '.join(words).strip()
 
-def get_nutrition_from_api(fdc_id):
+def get_nutrition_from_api(fdc_id, timeout=USDA_TIMEOUT):
     """Get nutrition data from USDA API"""
     try:
         params = {'api_key': USDA_API_KEY}
-        resp = requests.get(f"{DETAIL_URL}{fdc_id}", params=params, timeout=10)
+        resp = requests.get(f"{DETAIL_URL}{fdc_id}", params=params, timeout=timeout)
         
-        if resp.status_code == 200:
+        if resp.status_code != 200:
+            USDA_BREAKER.record_failure()
+        else:
+            USDA_BREAKER.record_success()
             data = resp.json()
             nutrients = {}
             
@@ -137,40 +165,120 @@ def get_nutrition_from_api(fdc_id):
         
         return None
     except Exception as e:
+        USDA_BREAKER.record_failure()
         print(f"Error getting nutrition from API for FDC ID {fdc_id}: {e}")
         return None
 
+@lru_cache(maxsize=FALLBACK_CACHE_SIZE)
+def _match_fallback(ingredient_lower):
+    return FALLBACK_INDEX.match(ingredient_lower)
+
 def get_fallback_nutrition(ingredient):
-    """Get nutrition data from fallback dictionary"""
-    ingredient_lower = ingredient.lower()
-    
-    # Try exact match first
-    if ingredient_lower in FALLBACK_NUTRITION:
-        return FALLBACK_NUTRITION[ingredient_lower]
-    
-    # Try partial matches
-    for key, value in FALLBACK_NUTRITION.items():
-        if key in ingredient_lower or ingredient_lower in key:
-            return value
-    
-    # Return default values if no match found
-    return {'calories': 50, 'protein': 2.0, 'fat': 1.0, 'carbs': 5.0, 'fiber': 2.0}
+    """Get nutrition data from the fallback table using ranked fuzzy matching"""
+    name = _match_fallback(ingredient.lower().strip())
+    if name is None:
+        return dict(DEFAULT_NUTRITION)
+    return dict(FALLBACK_NUTRITION[name])
 
-def analyze_nutrition(ingredients):
-    """Analyze nutrition for a list of ingredients"""
-    total = {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0 , 'fiber': 0}
+def ingredient_nutrition(ingredient, deadline=None):
+    """
+    Nutrition for one ingredient line as (nutrition, estimated).
+
+    Uses the USDA API while the circuit breaker allows it and there is time
+    left before deadline (a time.monotonic() value); otherwise, or if the
+    API gives nothing, the value comes from the fallback table and is
+    marked estimated.
+    """
+    nutrition = None
+    remaining = deadline - time.monotonic() if deadline is not None else USDA_TIMEOUT
+
+    # Try API first
+    if remaining > 0 and USDA_BREAKER.allow():
+        fdc_id = get_fdc_id(ingredient, timeout=min(USDA_TIMEOUT, remaining))
+        if fdc_id:
+            remaining = deadline - time.monotonic() if deadline is not None else USDA_TIMEOUT
+            if remaining > 0:
+                nutrition = get_nutrition_from_api(fdc_id, timeout=min(USDA_TIMEOUT, remaining))
+
+    # If API fails, use fallback
+    if not nutrition:
+        return get_fallback_nutrition(ingredient), True
+    return nutrition, False
+
+def line_fingerprint(ingredient):
+    """Key for a line's stored nutrition: its normalized text plus RULES_VERSION"""
+    normalized = ' '.join(ingredient.lower().split())
+    return hashlib.sha1(f"{RULES_VERSION}\n{normalized}".encode()).hexdigest()
+
+def stored_line_nutrition(ingredients):
+    """{fingerprint: nutrition} for the lines that already have stored USDA results"""
+    from .models import LineNutrition
+    fingerprints = {line_fingerprint(ingredient) for ingredient in ingredients}
+    return dict(
+        LineNutrition.objects.filter(fingerprint__in=fingerprints).values_list('fingerprint', 'nutrition')
+    )
+
+def stored_or_fallback(lines):
+    """
+    A line -> nutrition function for lines: stored USDA values where they
+    exist, else the fallback table. Never calls the API, so it suits the
+    optimizer's search.
+    """
+    stored = stored_line_nutrition(lines)
+
+    def line_nutrition(line):
+        nutrition = stored.get(line_fingerprint(line))
+        return nutrition if nutrition is not None else get_fallback_nutrition(line)
+    return line_nutrition
+
+def store_line_nutrition(ingredient, nutrition):
+    from .models import LineNutrition
+    LineNutrition.objects.bulk_create(
+        [LineNutrition(fingerprint=line_fingerprint(ingredient), line=ingredient, nutrition=nutrition)],
+        ignore_conflicts=True,
+    )
+
+def iter_nutrition(ingredients, deadline=NUTRITION_DEADLINE):
+    """
+    Yield (ingredient, nutrition, estimated) for each line as it resolves.
+
+    Lines with stored USDA results are answered from LineNutrition; new
+    USDA results are stored for next time. The whole run is bounded by
+    deadline seconds: once it runs out the remaining lines use fallback
+    values.
+    """
+    ends_at = time.monotonic() + deadline
+    stored = stored_line_nutrition(ingredients)
     
     for ingredient in ingredients:
-        nutrition = None
-        
-        # Try API first
-        fdc_id = get_fdc_id(ingredient)
-        if fdc_id:
-            nutrition = get_nutrition_from_api(fdc_id)
+        nutrition = stored.get(line_fingerprint(ingredient))
+        if nutrition is not None:
+            yield ingredient, nutrition, False
+            continue
+
+        nutrition, is_estimate = ingredient_nutrition(ingredient, ends_at)
+        if not is_estimate:
+            # Fallback values aren't stored, so the API gets another try next time
+            store_line_nutrition(ingredient, nutrition)
+        yield ingredient, nutrition, is_estimate
         
-        # If API fails, use fallback
-        if not nutrition:
-            nutrition = get_fallback_nutrition(ingredient)
+        # Small delay to avoid overwhelming the API
+        if not is_estimate and time.monotonic() + 0.1 < ends_at:
+            time.sleep(0.1)
+
+def sum_nutrition(lines):
+    """
+    Total the (ingredient, nutrition, estimated) results from iter_nutrition.
+
+    Lines whose values came from the fallback table are listed under
+    'estimated'.
+    """
+    total = {'calories': 0, 'protein': 0, 'fat': 0, 'carbs': 0 , 'fiber': 0}
+    estimated = []
+    
+    for ingredient, nutrition, is_estimate in lines:
+        if is_estimate:
+            estimated.append(ingredient)
         
         # Add to totals
         total['calories'] += nutrition['calories']
@@ -178,9 +286,6 @@ def analyze_nutrition(ingredients):
         total['fat'] += nutrition['fat']
         total['carbs'] += nutrition['carbs']
         total['fiber'] += nutrition['fiber']
-        
-        # Small delay to avoid overwhelming the API
-        time.sleep(0.1)
     
     # Round the values
     total['calories'] = round(total['calories'], 1)
@@ -188,5 +293,47 @@ def analyze_nutrition(ingredients):
     total['fat'] = round(total['fat'], 1)
     total['carbs'] = round(total['carbs'], 1)
     total['fiber'] = round(total['fiber'], 1)
+    total['estimated'] = estimated
 
     return total
+
+def analyze_nutrition(ingredients, deadline=NUTRITION_DEADLINE):
+    """Analyze nutrition for a list of ingredients within deadline seconds"""
+    return sum_nutrition(iter_nutrition(ingredients, deadline))
+
+def recompute_nutrition(old_ingredients, old_nutrition, ingredients, deadline=NUTRITION_DEADLINE):
+    """
+    Totals for ingredients given the previous lines and their totals.
+
+    Returns (nutrition, changed lines). Lines not in the old set are looked
+    up, and so are unchanged lines with no stored USDA result unless the old
+    totals list them as estimated (stored before per-line results, or under
+    another RULES_VERSION); both count as changed. Other unchanged lines
+    take their stored values, or the fallback table if they were estimated
+    before. With no new lines the old totals are returned as they are.
+    """
+    old_fingerprints = {line_fingerprint(ingredient) for ingredient in old_ingredients}
+    new_lines = [ingredient for ingredient in ingredients if line_fingerprint(ingredient) not in old_fingerprints]
+    if not new_lines and old_nutrition and sorted(old_ingredients) == sorted(ingredients):
+        return old_nutrition, []
+
+    stored = stored_line_nutrition(ingredients)
+    old_estimated = {line_fingerprint(ingredient) for ingredient in (old_nutrition or {}).get('estimated', [])}
+    changed = [
+        ingredient for ingredient in ingredients
+        if ingredient in new_lines
+        or (line_fingerprint(ingredient) not in stored and line_fingerprint(ingredient) not in old_estimated)
+    ]
+    looked_up = {ingredient: (nutrition, is_estimate)
+                 for ingredient, nutrition, is_estimate in iter_nutrition(changed, deadline)}
+
+    lines = []
+    for ingredient in ingredients:
+        if ingredient in looked_up:
+            nutrition, is_estimate = looked_up[ingredient]
+        elif line_fingerprint(ingredient) in stored:
+            nutrition, is_estimate = stored[line_fingerprint(ingredient)], False
+        else:
+            nutrition, is_estimate = get_fallback_nutrition(ingredient), True
+        lines.append((ingredient, nutrition, is_estimate))
+    return sum_nutrition(lines), changed
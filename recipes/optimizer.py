@@ -0,0 +1,208 @@
+import math
+import time
+
+from .food_index import NUTRIENT_FIELDS
+from .ml_utils import SUBSTITUTIONS, substitution_candidates
+from .nutrition import get_fallback_nutrition
+
+# Wall-clock budget for one optimization, in seconds
+OPTIMIZE_BUDGET = 0.2
+
+# Form fields / target keys understood by optimize_ingredients
+TARGET_FIELDS = [f'{bound}_{field}' for field in NUTRIENT_FIELDS for bound in ('max', 'min')]
+
+
+def parse_targets(data):
+    """Pull finite numeric max_*/min_* targets out of a dict-like (e.g. request.POST)"""
+    targets = {}
+    for name in TARGET_FIELDS:
+        value = data.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        # 'nan' and 'inf' parse as floats but make every score NaN and
+        # serialize to invalid JSON
+        if math.isfinite(value):
+            targets[name] = value
+    return targets
+
+
+def _vector(nutrition):
+    return tuple(float(nutrition.get(field, 0) or 0) for field in NUTRIENT_FIELDS)
+
+
+def _line_options(ing, restriction, line_nutrition):
+    """
+    Candidate lines for one ingredient as (text, vector, changed) tuples.
+
+    When the user asked for a restriction and the line breaks it, only that
+    restriction's substitutions are allowed; otherwise the original line
+    competes with every substitution the rules know about.
+    """
+    candidates = substitution_candidates(ing)
+    required = restriction in SUBSTITUTIONS and any(r == restriction for r, _, _ in candidates)
+
+    options = []
+    seen = set()
+    if not required:
+        options.append((ing, _vector(line_nutrition(ing)), False))
+        seen.add(ing.lower())
+    for candidate_restriction, _, text in candidates:
+        if required and candidate_restriction != restriction:
+            continue
+        if text in seen:
+            continue
+        seen.add(text)
+        options.append((text, _vector(line_nutrition(text)), True))
+    return options
+
+
+def _constraints(targets):
+    """Turn max_*/min_* targets into (field index, is_max, limit) triples"""
+    constraints = []
+    for name, limit in targets.items():
+        bound, _, field = name.partition('_')
+        if field in NUTRIENT_FIELDS and bound in ('max', 'min') and math.isfinite(float(limit)):
+            constraints.append((NUTRIENT_FIELDS.index(field), bound == 'max', float(limit)))
+    return constraints
+
+
+def targets_met(nutrition, targets):
+    """Whether nutrition totals (e.g. from analyze_nutrition) meet every target"""
+    return _violation(_vector(nutrition), _constraints(targets)) == 0
+
+
+def _violation(totals, constraints):
+    """Sum of relative constraint violations; 0 means every target is met"""
+    violation = 0.0
+    for index, is_max, limit in constraints:
+        scale = abs(limit) or 1.0
+        if is_max:
+            violation += max(0.0, totals[index] - limit) / scale
+        else:
+            violation += max(0.0, limit - totals[index]) / scale
+    return violation
+
+
+def optimize_ingredients(ingredients, targets, restriction='', budget=OPTIMIZE_BUDGET,
+                         line_nutrition=get_fallback_nutrition):
+    """
+    Search substitution combinations for the variant that best meets targets.
+
+    targets maps 'max_<nutrient>' / 'min_<nutrient>' to a number, e.g.
+    {'max_calories': 500, 'min_protein': 30}. Variants are ranked by total
+    relative violation of the targets, then by how few lines were changed.
+    A greedy pass seeds the incumbent, then a depth-first branch-and-bound
+    over the per-line options improves it until the search space is
+    exhausted or the time budget runs out.
+
+    Line nutrition comes from line_nutrition (the local fallback table by
+    default, or nutrition.stored_or_fallback) so the search never waits on
+    the network. 'feasible' is judged on those values; callers should run
+    analyze_nutrition on the chosen lines and check them with targets_met.
+    """
+    started = time.perf_counter()
+    deadline = started + budget
+    constraints = _constraints(targets)
+    options = [_line_options(ing, restriction, line_nutrition) for ing in ingredients]
+    size = len(NUTRIENT_FIELDS)
+
+    def add(a, b):
+        return tuple(x + y for x, y in zip(a, b))
+
+    # Suffix bounds: the smallest and largest each nutrient can still grow by
+    # from line i to the end, used for the branch-and-bound lower bound.
+    suffix_min = [(0.0,) * size] * (len(options) + 1)
+    suffix_max = [(0.0,) * size] * (len(options) + 1)
+    for i in range(len(options) - 1, -1, -1):
+        suffix_min[i] = add(suffix_min[i + 1], tuple(min(o[1][k] for o in options[i]) for k in range(size)))
+        suffix_max[i] = add(suffix_max[i + 1], tuple(max(o[1][k] for o in options[i]) for k in range(size)))
+
+    def lower_bound(i, totals):
+        bound = 0.0
+        for index, is_max, limit in constraints:
+            scale = abs(limit) or 1.0
+            if is_max:
+                bound += max(0.0, totals[index] + suffix_min[i][index] - limit) / scale
+            else:
+                bound += max(0.0, limit - totals[index] - suffix_max[i][index]) / scale
+        return bound
+
+    def score(choice):
+        totals = (0.0,) * size
+        changes = 0
+        for i, c in enumerate(choice):
+            totals = add(totals, options[i][c][1])
+            changes += options[i][c][2]
+        return (_violation(totals, constraints), changes)
+
+    stats = {'evaluated': 0, 'complete': True}
+
+    # Greedy seed: start from the first allowed option per line, then keep
+    # applying the single swap that cuts the violation the most.
+    best_choice = [0] * len(options)
+    best_score = score(best_choice)
+    improved = True
+    while improved and best_score[0] > 0 and time.perf_counter() < deadline:
+        improved = False
+        for i, line_options in enumerate(options):
+            for c in range(len(line_options)):
+                if c == best_choice[i]:
+                    continue
+                trial = best_choice[:i] + [c] + best_choice[i + 1:]
+                trial_score = score(trial)
+                stats['evaluated'] += 1
+                if trial_score[0] < best_score[0]:
+                    best_choice, best_score, improved = trial, trial_score, True
+
+    # Try options that move totals towards the targets first
+    def direction(option):
+        return sum((option[1][index] if is_max else -option[1][index]) / (abs(limit) or 1.0)
+                   for index, is_max, limit in constraints)
+
+    order = [sorted(range(len(line_options)), key=lambda c: (line_options[c][2], direction(line_options[c])))
+             for line_options in options]
+
+    choice = [0] * len(options)
+
+    def search(i, totals, changes):
+        nonlocal best_choice, best_score
+        if not stats['complete']:
+            return
+        stats['evaluated'] += 1
+        if stats['evaluated'] % 64 == 0 and time.perf_counter() > deadline:
+            stats['complete'] = False
+            return
+        if (lower_bound(i, totals), changes) >= best_score:
+            return
+        if i == len(options):
+            best_choice, best_score = list(choice), (_violation(totals, constraints), changes)
+            return
+        for c in order[i]:
+            option = options[i][c]
+            choice[i] = c
+            search(i + 1, add(totals, option[1]), changes + option[2])
+
+    if constraints and time.perf_counter() < deadline:
+        search(0, (0.0,) * size, 0)
+    elif time.perf_counter() >= deadline:
+        stats['complete'] = False
+
+    totals = (0.0,) * size
+    for i, c in enumerate(best_choice):
+        totals = add(totals, options[i][c][1])
+
+    elapsed = time.perf_counter() - started
+    return {
+        'ingredients': [options[i][c][0] for i, c in enumerate(best_choice)],
+        'estimated_nutrition': {field: round(totals[k], 1) for k, field in enumerate(NUTRIENT_FIELDS)},
+        'changed_lines': best_score[1],
+        'feasible': best_score[0] == 0,
+        'optimal': stats['complete'],
+        'evaluated': stats['evaluated'],
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'candidates_per_second': round(stats['evaluated'] / elapsed) if elapsed > 0 else 0,
+    }
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import time
+import traceback
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .dedup import find_duplicate, minhash_signature
+from .ml_utils import modify_ingredients, substitution_candidates
+from .models import Recipe
+from .nutrition import RULES_VERSION, iter_nutrition, recompute_nutrition, stored_or_fallback, sum_nutrition
+from .optimizer import optimize_ingredients, targets_met
+from .scraper import scrape_recipe
+
+# How long a processed recipe context stays cached, in seconds
+RECIPE_CACHE_TIMEOUT = 3600
+
+# How long a submitted recipe job waits for its stream to be opened, in seconds
+RECIPE_JOB_TIMEOUT = 300
+
+
+def recipe_generation(url):
+    """
+    Current generation of a page's cached contexts, part of their cache keys.
+
+    Like favorites_version, a timestamp, so an evicted generation never
+    comes back as one older contexts were cached under.
+    """
+    key = f"recipe_gen_{url}"
+    generation = cache.get(key)
+    if generation is None:
+        generation = time.time_ns()
+        cache.set(key, generation, None)
+    return generation
+
+
+def bump_recipe_generation(url):
+    """Drop every cached context for a page, whatever it was submitted with"""
+    cache.set(f"recipe_gen_{url}", time.time_ns(), None)
+
+
+def recipe_cache_key(url, restriction, targets):
+    """Unique cache key for one url/restriction/targets submission of the page as currently stored"""
+    cache_key = f"recipe_{url}_{recipe_generation(url)}_restriction_{restriction}"
+    if targets:
+        cache_key += '_targets_' + '_'.join(f"{k}={v:g}" for k, v in sorted(targets.items()))
+    return cache_key
+
+
+# Bulky context values, cached once per distinct content under a key derived
+# from it; the entry for a submission holds those keys instead of copies
+BLOB_FIELDS = ('original_ingredients', 'modified_ingredients', 'instructions')
+
+
+def blob_key(value):
+    return 'recipe_blob_' + hashlib.sha1(json.dumps(value).encode()).hexdigest()
+
+
+def split_context(context):
+    """A context without its BLOB_FIELDS, plus {blob key: value} for them"""
+    compact = {key: value for key, value in context.items() if key not in BLOB_FIELDS}
+    compact['blobs'] = {field: blob_key(context[field]) for field in BLOB_FIELDS}
+    return compact, {compact['blobs'][field]: context[field] for field in BLOB_FIELDS}
+
+
+def cache_context(cache_key, context):
+    """
+    Cache a successful recipe context with its bulky fields stored by content.
+
+    Every submission of a page (one per restriction or set of targets)
+    shares the same original lines and instructions, and unchanged
+    modified lines equal the original ones, so each is stored once. The
+    keys are content hashes, so a cached entry never points at data a later
+    submission or re-scrape can change.
+    """
+    compact, entries = split_context(context)
+    entries[cache_key] = compact
+    cache.set_many(entries, RECIPE_CACHE_TIMEOUT)
+
+
+def cached_context(cache_key):
+    """The context stored by cache_context, or None if it or any of its parts expired"""
+    compact = cache.get(cache_key)
+    if not compact or 'blobs' not in compact:
+        # Entries cached before contexts were split are complete already
+        return compact or None
+    blobs = cache.get_many(set(compact['blobs'].values()))
+    if len(blobs) < len(set(compact['blobs'].values())):
+        return None
+    context = {key: value for key, value in compact.items() if key != 'blobs'}
+    for field, key in compact['blobs'].items():
+        context[field] = blobs[key]
+    return context
+
+
+def create_recipe_job(owner, url, restriction='', targets=None):
+    """Store a submission for a later recipe stream to run; returns its job id"""
+    job_id = uuid.uuid4().hex
+    cache.set(f"recipe_job_{job_id}", {
+        'owner': owner,
+        'url': url,
+        'restriction': restriction,
+        'targets': targets or {},
+    }, RECIPE_JOB_TIMEOUT)
+    return job_id
+
+
+def get_recipe_job(job_id):
+    return cache.get(f"recipe_job_{job_id}")
+
+
+def claim_recipe_job(job_id, owner):
+    """
+    Take a job for streaming; returns its parameters, or None.
+
+    A job runs at most once and only for the session that created it, so a
+    replayed, shared or prefetched stream URL never triggers a scrape.
+    """
+    key = f"recipe_job_{job_id}"
+    job = cache.get(key)
+    if job is None or job['owner'] != owner or not cache.delete(key):
+        return None
+    return job
+
+
+def modify_for(ingredients, restriction='', targets=None):
+    """Apply a submission's targets or dietary restriction; returns (ingredients, optimization)"""
+    if targets:
+        # Search substitution combinations for the nutrition targets, scoring
+        # lines by their stored USDA values where there are any
+        lines = [*ingredients, *(text for ing in ingredients for _, _, text in substitution_candidates(ing))]
+        optimization = optimize_ingredients(ingredients, targets, restriction,
+                                            line_nutrition=stored_or_fallback(lines))
+        modified_ingredients = optimization.pop('ingredients')
+        optimization['targets'] = targets
+        return modified_ingredients, optimization
+    if restriction:
+        return modify_ingredients(ingredients, restriction), None
+    return ingredients, None
+
+
+def process_recipe(url, restriction='', targets=None):
+    """
+    Scrape, modify and analyze a recipe, yielding (event, data) as each stage completes.
+
+    Events, in order: 'recipe' once the page is scraped, 'modified' with the
+    substituted lines, one 'nutrition' per ingredient line as its lookup
+    resolves, then 'done' with the full recipe context (also cached and
+    stored on the Recipe row). Any failure ends the stream with 'failed'.
+    A cached submission yields 'done' straight away.
+    """
+    cache_key = recipe_cache_key(url, restriction, targets)
+    recipe_context = cached_context(cache_key)
+    if recipe_context:
+        yield 'done', recipe_context
+        return
+
+    try:
+        # Scrape the recipe
+        recipe = scrape_recipe(url)
+        instructions = '\n'.join(recipe['instructions']) if recipe['instructions'] else 'Instructions not found'
+        yield 'recipe', {
+            'title': recipe['title'],
+            'original_ingredients': recipe['ingredients'],
+            'instructions': instructions,
+        }
+
+        # Modify ingredients based on dietary restriction
+        modified_ingredients, optimization = modify_for(recipe['ingredients'], restriction, targets)
+        yield 'modified', {
+            'modified_ingredients': modified_ingredients,
+            'restriction': restriction,
+            'optimization': optimization,
+        }
+
+        # Look for the same recipe syndicated under another URL
+        signature = minhash_signature(recipe['title'], modified_ingredients)
+        duplicate, _ = find_duplicate(signature, exclude_url=url)
+
+        # Analyze nutrition (using API), reusing a near-duplicate's stored values
+        if duplicate and duplicate.nutrition:
+            nutrition = duplicate.nutrition
+        else:
+            lines = []
+            for index, (ingredient, line_nutrition, is_estimate) in enumerate(iter_nutrition(modified_ingredients)):
+                lines.append((ingredient, line_nutrition, is_estimate))
+                yield 'nutrition', {
+                    'index': index,
+                    'ingredient': ingredient,
+                    'nutrition': line_nutrition,
+                    'estimated': is_estimate,
+                }
+            nutrition = sum_nutrition(lines)
+
+        if optimization:
+            # The search judged the targets on its own line values; the
+            # page shows these totals, so they decide whether they were met
+            optimization['feasible'] = targets_met(nutrition, targets)
+
+        if duplicate and settings.RECIPE_DEDUP_MODE == 'merge':
+            # Point this submission at the existing recipe instead of storing a copy
+            recipe_obj = duplicate
+        else:
+            # Create or get recipe with all necessary data
+            recipe_obj, created = Recipe.objects.update_or_create(
+                source_url=url,
+                defaults={
+                    'title': recipe['title'],
+                    'instructions': instructions,
+                    'ingredients': modified_ingredients,
+                    'nutrition': nutrition,
+                    'minhash': signature,
+                    'duplicate_of': duplicate,
+                    'restriction': restriction,
+                    'targets': targets or {},
+                    'etag': recipe['etag'],
+                    'last_modified': recipe['last_modified'],
+                    'fetched_at': timezone.now(),
+                    'rules_version': RULES_VERSION,
+                }
+            )
+
+        # Prepare context for session and cache
+        recipe_context = {
+            'title': recipe['title'],
+            'original_ingredients': recipe['ingredients'],
+            'modified_ingredients': recipe_obj.ingredients,
+            'instructions': instructions,
+            'nutrition': nutrition,
+            'restriction': restriction,
+            'optimization': optimization,
+            'duplicate_of': duplicate.source_url if duplicate else None,
+            'recipe_id': recipe_obj.id,
+            'success': True
+        }
+
+        # Cache the result for 1 hour
+        cache_context(cache_key, recipe_context)
+
+    except Exception as e:
+        print(f"Error in recipe processing: {traceback.format_exc()}")
+        yield 'failed', {
+            'error': f"Error processing recipe: {str(e)}",
+            'url': url,
+            'restriction': restriction,
+            'success': False
+        }
+        return
+
+    yield 'done', recipe_context
+
+
+def run_recipe_pipeline(url, restriction='', targets=None):
+    """Run process_recipe to completion and return the final context"""
+    recipe_context = None
+    for _, recipe_context in process_recipe(url, restriction, targets):
+        pass
+    return recipe_context
+
+
+def is_variant_of(ingredients, lines):
+    """Whether each of ingredients is the matching line or one of its substitutions"""
+    return len(ingredients) == len(lines) and all(
+        ingredient == line or ingredient in {text for _, _, text in substitution_candidates(line)}
+        for ingredient, line in zip(ingredients, lines)
+    )
+
+
+def refresh_recipe(recipe, force=False):
+    """
+    Re-scrape a stored recipe and bring it up to date.
+
+    The fetch is conditional on the stored ETag/Last-Modified unless force
+    is set or the recipe was derived under other rules (RULES_VERSION). The
+    stored restriction and targets are re-applied to the new ingredients
+    (an optimized variant that still fits the page is kept as it is), and
+    nutrition is recomputed only for lines that changed. An update
+    drops the page's cached contexts.
+    Returns ('not_modified' | 'unchanged' | 'updated', changed lines).
+    """
+    if force or recipe.rules_version != RULES_VERSION:
+        scraped = scrape_recipe(recipe.source_url)
+    else:
+        scraped = scrape_recipe(recipe.source_url, recipe.etag, recipe.last_modified)
+    if scraped is None:
+        Recipe.objects.filter(pk=recipe.pk).update(fetched_at=timezone.now())
+        return 'not_modified', []
+
+    validators = {
+        'etag': scraped['etag'],
+        'last_modified': scraped['last_modified'],
+        'fetched_at': timezone.now(),
+        'rules_version': RULES_VERSION,
+    }
+    if (recipe.targets and recipe.rules_version == RULES_VERSION
+            and is_variant_of(recipe.ingredients, scraped['ingredients'])):
+        # The optimizer's search is time-bounded and may settle elsewhere on
+        # a rerun, so a stored choice that still fits the page is kept
+        ingredients = recipe.ingredients
+    else:
+        ingredients, _ = modify_for(scraped['ingredients'], recipe.restriction, recipe.targets)
+    instructions = '\n'.join(scraped['instructions']) if scraped['instructions'] else 'Instructions not found'
+    if (ingredients == recipe.ingredients and recipe.nutrition
+            and scraped['title'] == recipe.title and instructions == recipe.instructions):
+        # Same recipe; skip the save (and its signals) beyond the validators
+        Recipe.objects.filter(pk=recipe.pk).update(**validators)
+        return 'unchanged', []
+
+    nutrition, changed = recompute_nutrition(recipe.ingredients, recipe.nutrition, ingredients)
+    fields = {
+        **validators,
+        'title': scraped['title'],
+        'instructions': instructions,
+        'ingredients': ingredients,
+        'nutrition': nutrition,
+        'minhash': minhash_signature(scraped['title'], ingredients),
+    }
+    for name, value in fields.items():
+        setattr(recipe, name, value)
+    # auto_now fields are only written when listed
+    recipe.save(update_fields=[*fields, 'updated_at'])
+    bump_recipe_generation(recipe.source_url)
+    return 'updated', changed
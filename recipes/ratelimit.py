@@ -0,0 +1,128 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+class TokenBucket:
+    """
+    Token bucket whose state lives in the default cache.
+
+    A client may burst `capacity` requests, refilled at capacity/period per
+    second. Consumed tokens are counted with cache.incr, so workers sharing
+    the cache (Redis) never admit more than the bucket holds; with the
+    per-process LocMemCache each worker has its own buckets, which
+    `check --deploy` reports (recipes.E001). The bucket start time is only moved
+    forward when the client has been idle long enough to refill completely.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.timeout = int(period * 2)
+
+    def take(self, key):
+        """Consume one token; return 0 if allowed, else seconds until a token is free"""
+        now = time.time()
+        start_key, used_key = f"{key}_start", f"{key}_used"
+        cache.add(start_key, now, self.timeout)
+        start = cache.get(start_key, now)
+        cache.add(used_key, 0, self.timeout)
+        try:
+            used = cache.incr(used_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            used = 1
+            cache.set(used_key, used, self.timeout)
+
+        credit = self.capacity + (now - start) * self.rate
+        if used > credit:
+            # Refund: throttled requests don't eat into the next window
+            try:
+                cache.decr(used_key)
+            except ValueError:
+                pass
+            return max(1, math.ceil((used - credit) / self.rate))
+
+        if credit - used > self.capacity - 1:
+            # Idle long enough to be full again; cap the stored credit
+            cache.set(start_key, now - (used - 1) / self.rate, self.timeout)
+        else:
+            cache.touch(start_key, self.timeout)
+        cache.touch(used_key, self.timeout)
+        return 0
+
+
+def client_key(request):
+    """Logged-in users are limited per account, everyone else per IP address"""
+    if request.user.is_authenticated:
+        return 'authenticated', f"user{request.user.pk}"
+    return 'anonymous', f"ip{request.META.get('REMOTE_ADDR', '')}"
+
+
+def record(route, outcome):
+    key = f"ratelimit_stats_{route}_{outcome}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def rate_limit_stats():
+    """{route: {'allowed': n, 'throttled': n}} for every configured route, across workers"""
+    keys = {
+        f"ratelimit_stats_{route}_{outcome}": (route, outcome)
+        for route in settings.RATE_LIMITS for outcome in ('allowed', 'throttled')
+    }
+    values = cache.get_many(list(keys))
+    stats = {route: {'allowed': 0, 'throttled': 0} for route in settings.RATE_LIMITS}
+    for key, (route, outcome) in keys.items():
+        stats[route][outcome] = values.get(key, 0)
+    return stats
+
+
+class RateLimitMiddleware:
+    """
+    Applies settings.RATE_LIMITS to requests by URL name.
+
+    Each entry gives the HTTP methods it covers and a (requests, seconds)
+    limit for anonymous and for logged-in clients. Routes in
+    RATE_LIMIT_EXEMPT, or not listed at all, are never limited. Throttled
+    requests get a 429 with Retry-After.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.buckets = {
+            route: {kind: TokenBucket(*config[kind]) for kind in ('anonymous', 'authenticated')}
+            for route, config in settings.RATE_LIMITS.items()
+        }
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not settings.RATE_LIMIT_ENABLED:
+            return None
+        route = request.resolver_match.url_name
+        if route in settings.RATE_LIMIT_EXEMPT or route not in self.buckets:
+            return None
+        if request.method not in settings.RATE_LIMITS[route]['methods']:
+            return None
+
+        kind, client = client_key(request)
+        retry_after = self.buckets[route][kind].take(f"ratelimit_{route}_{client}")
+        if not retry_after:
+            record(route, 'allowed')
+            return None
+
+        record(route, 'throttled')
+        response = HttpResponse(
+            f"Too many requests. Try again in {retry_after} seconds.",
+            status=429, content_type='text/plain',
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
@@ -1,203 +1,568 @@
 import requests
 from bs4 import BeautifulSoup
+import codecs
+import json
+import os
 import re
+import threading
+import time
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
 
-def scrape_recipe(url):
+from .executors import get_parse_executor
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Patterns shared by the extractors, compiled once at import
+TITLE_CLASS_RE = re.compile(r'title|recipe-title|entry-title', re.IGNORECASE)
+INGREDIENT_CLASS_RE = re.compile(r'ingredient|ingredients')
+INGREDIENT_SECTION_CLASS_RE = re.compile(r'recipe|ingredients')
+INGREDIENTS_CLASS_RE = re.compile(r'ingredients', re.IGNORECASE)
+METHOD_CLASS_RE = re.compile(r'method|instruction|step')
+STEP_CLASS_RE = re.compile(r'step')
+INSTRUCTIONS_CLASS_RE = re.compile(r'method|instruction|procedure|recipe-instructions', re.IGNORECASE)
+LEADING_SYMBOLS_RE = re.compile(r'^[\W\s]+')
+MEASUREMENT_WORDS = ['cup', 'tbsp', 'tsp', 'gram', 'ounce', 'pound', 'kg', 'ml', 'g', 'oz', 'lb']
+
+# Pages are read in chunks and never beyond MAX_PAGE_BYTES
+MAX_PAGE_BYTES = int(os.getenv('SCRAPER_MAX_BYTES', 5 * 1024 * 1024))
+FETCH_CHUNK_SIZE = 64 * 1024
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+CHARSET_RE = re.compile(r'charset=["\']?([\w.:-]+)', re.IGNORECASE)
+
+
+class Selector:
+    """
+    One declarative extraction rule.
+
+    Finds container elements by tag name plus class/id, then takes the text
+    of each container (or of its `items` children). Text no longer than
+    min_len is dropped; strip_symbols removes leading bullets/checkboxes.
+    With many=False only the first matching container is used.
+    """
+
+    def __init__(self, name, class_=None, id=None, items=None, many=True, min_len=0, strip_symbols=False):
+        self.name = name
+        self.attrs = {}
+        if class_ is not None:
+            self.attrs['class_'] = class_
+        if id is not None:
+            self.attrs['id'] = id
+        self.items = items
+        self.many = many
+        self.min_len = min_len
+        self.strip_symbols = strip_symbols
+
+    def texts(self, soup):
+        if self.many:
+            containers = soup.find_all(self.name, **self.attrs)
+        else:
+            container = soup.find(self.name, **self.attrs)
+            containers = [container] if container else []
+
+        results = []
+        for container in containers:
+            elements = container.find_all(self.items) if self.items else [container]
+            for elem in elements:
+                text = ' '.join(elem.stripped_strings)
+                if self.strip_symbols:
+                    text = LEADING_SYMBOLS_RE.sub('', text)
+                if text and len(text) > self.min_len:
+                    results.append(text)
+        return results
+
+    def first_text(self, soup):
+        elem = soup.find(self.name, **self.attrs)
+        return elem.get_text(strip=True) if elem else None
+
+
+class SiteExtractor:
+    """Title/ingredient/instruction rules for one group of sites; rules are tried in order"""
+
+    def __init__(self, name, hosts, title=(), ingredients=(), instructions=()):
+        self.name = name
+        self.hosts = hosts
+        self.title = list(title)
+        self.ingredients = list(ingredients)
+        self.instructions = list(instructions)
+
+    def extract_title(self, soup):
+        for selector in self.title:
+            text = selector.first_text(soup)
+            if text:
+                return text
+        return None
+
+    def _extract_list(self, rules, soup):
+        for selector in rules:
+            texts = selector.texts(soup)
+            if texts:
+                return texts
+        return []
+
+    def extract_ingredients(self, soup):
+        return self._extract_list(self.ingredients, soup)
+
+    def extract_instructions(self, soup):
+        return self._extract_list(self.instructions, soup)
+
+
+COMMON_SITE_TITLE = Selector('h1', class_=TITLE_CLASS_RE)
+COMMON_SITE_INGREDIENTS = Selector('div', class_=INGREDIENTS_CLASS_RE, items='li', many=False, strip_symbols=True)
+COMMON_SITE_INSTRUCTIONS = Selector(['div', 'ol'], class_=INSTRUCTIONS_CLASS_RE, items=['li', 'p'], many=False, min_len=10)
+
+SITE_EXTRACTORS = [
+    SiteExtractor(
+        'bbcgoodfood',
+        hosts=['bbcgoodfood.com'],
+        title=[Selector('h1', class_='heading__title'), Selector('h1')],
+        ingredients=[
+            Selector(['li', 'p'], class_=INGREDIENT_CLASS_RE, min_len=3),
+            # Otherwise take list items from any recipe/ingredients section
+            Selector(['section', 'div'], class_=INGREDIENT_SECTION_CLASS_RE, items='li', min_len=3),
+        ],
+        instructions=[
+            Selector(['li', 'p'], class_=METHOD_CLASS_RE, min_len=10),
+            Selector(['li', 'p'], class_=STEP_CLASS_RE, min_len=10),
+        ],
+    ),
+    SiteExtractor(
+        'allrecipes',
+        hosts=['allrecipes.com'],
+        title=[Selector('h1', class_='recipe-title')],
+        ingredients=[Selector('span', class_='ingredients-item-name')],
+        instructions=[Selector('div', class_='paragraph')],
+    ),
+    SiteExtractor(
+        'simplyrecipes',
+        hosts=['simplyrecipes.com'],
+        title=[COMMON_SITE_TITLE],
+        ingredients=[COMMON_SITE_INGREDIENTS],
+        instructions=[Selector('div', id='structured-project__steps_1-0', items='p', many=False, min_len=10)],
+    ),
+    SiteExtractor(
+        'common',
+        hosts=[
+            'foodfood.com', 'indianhealthyrecipes.com', 'recipes.timesofindia.com',
+            'archanaskitchen.com', 'food.ndtv.com', 'vegrecipesofindia.com',
+            'recipetineats.com',
+        ],
+        title=[COMMON_SITE_TITLE],
+        ingredients=[COMMON_SITE_INGREDIENTS],
+        instructions=[COMMON_SITE_INSTRUCTIONS],
+    ),
+]
+
+# Hostname -> extractor, for O(1) dispatch
+EXTRACTORS_BY_HOST = {host: extractor for extractor in SITE_EXTRACTORS for host in extractor.hosts}
+
+
+def match_host(url):
+    """
+    Return (site, extractor) for a URL: the registered host and its SiteExtractor.
+
+    Tries the full hostname, then each parent domain, so 'www.' and mobile
+    subdomains resolve to the registered site. Unknown sites give their own
+    hostname (without 'www.') and None.
+    """
+    hostname = (urlsplit(url).hostname or '').lower()
+    host = hostname
+    while host:
+        extractor = EXTRACTORS_BY_HOST.get(host)
+        if extractor:
+            return host, extractor
+        _, _, host = host.partition('.')
+    return (hostname[4:] if hostname.startswith('www.') else hostname), None
+
+
+def get_extractor(url):
+    """Return the SiteExtractor for a URL's host, or None for unknown sites"""
+    return match_host(url)[1]
+
+
+class ExtractorStats:
+    """
+    Per-site extraction counters, kept in-process.
+
+    Keyed by the registered host a page matched (or its own hostname for
+    unknown sites), so a layout change on one of the sites sharing an
+    extractor shows up on its own. A 'success' is a page where the site's
+    own rules found the ingredients and instructions; anything that fell
+    through to the generic find_all sweeps counts as a fallback. Past
+    max_domains sites, new ones are counted under 'other'.
+    """
+
+    def __init__(self, max_domains=500):
+        self.lock = threading.Lock()
+        self.domains = {}
+        self.max_domains = max_domains
+
+    def record(self, domain, success, parse_seconds, page=None, jsonld=False, extractor=None):
+        with self.lock:
+            if domain not in self.domains and len(self.domains) >= self.max_domains:
+                domain, extractor = 'other', None
+            stats = self.domains.setdefault(domain, {
+                'extractor': extractor or 'generic',
+                'pages': 0, 'successes': 0, 'fallbacks': 0, 'jsonld': 0, 'parse_seconds': 0.0,
+                'bytes_read': 0, 'bytes_saved': 0, 'early_stops': 0, 'truncated': 0,
+            })
+            stats['pages'] += 1
+            stats['successes' if success else 'fallbacks'] += 1
+            stats['jsonld'] += jsonld
+            stats['parse_seconds'] += parse_seconds
+            if page is not None:
+                stats['bytes_read'] += page.bytes_read
+                stats['bytes_saved'] += page.bytes_saved
+                stats['early_stops'] += page.stopped_early
+                stats['truncated'] += page.truncated
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                domain: {
+                    **stats,
+                    'success_rate': round(stats['successes'] / stats['pages'], 3),
+                    'avg_parse_ms': round(stats['parse_seconds'] / stats['pages'] * 1000, 2),
+                }
+                for domain, stats in self.domains.items()
+            }
+
+
+extractor_stats = ExtractorStats()
+
+
+def _is_recipe(node):
+    kind = node.get('@type') if isinstance(node, dict) else None
+    return kind == 'Recipe' or (isinstance(kind, list) and 'Recipe' in kind)
+
+
+def find_recipe_ld(data):
+    """The schema.org Recipe object in a parsed JSON-LD block, or None"""
+    nodes = [data]
+    while nodes:
+        node = nodes.pop(0)
+        if isinstance(node, list):
+            nodes.extend(node)
+        elif isinstance(node, dict):
+            if _is_recipe(node):
+                return node
+            nodes.extend(node.get('@graph', []))
+    return None
+
+
+def _clean_text(text):
+    return ' '.join(BeautifulSoup(text, 'html.parser').get_text(' ').split())
+
+
+def _ld_instructions(value):
+    """Flatten recipeInstructions: text, HowToStep, HowToSection or lists of them"""
+    if isinstance(value, str):
+        return [line for line in (_clean_text(part) for part in value.split('\n')) if line]
+    if isinstance(value, list):
+        return [line for item in value for line in _ld_instructions(item)]
+    if isinstance(value, dict):
+        if 'itemListElement' in value:
+            return _ld_instructions(value['itemListElement'])
+        return _ld_instructions(value.get('text') or value.get('name') or '')
+    return []
+
+
+def recipe_from_ld(recipe_ld):
+    """(title, ingredients, instructions) from a JSON-LD Recipe"""
+    ingredients = recipe_ld.get('recipeIngredient') or recipe_ld.get('ingredients') or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    return (
+        _clean_text(recipe_ld.get('name') or ''),
+        [line for line in (_clean_text(item) for item in ingredients if isinstance(item, str)) if line],
+        _ld_instructions(recipe_ld.get('recipeInstructions') or []),
+    )
+
+
+class PageWatcher(HTMLParser):
+    """
+    Incremental parser fed while a page downloads, to spot when the recipe is complete.
+
+    Complete means a JSON-LD Recipe with ingredients and instructions has
+    been read, or a top-level ingredient section followed by an
+    instruction section (div/section/ol/ul whose class matches the
+    common-site patterns, holding at least one li or p) have both been
+    closed.
+    """
+
+    CONTAINERS = {'div', 'section', 'ol', 'ul'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.recipe_ld = None
+        self.closed_sections = set()
+        self.stack = []
+        self.in_ld = False
+        self.ld_parts = []
+
+    @property
+    def complete(self):
+        return self.recipe_ld is not None or self.closed_sections >= {'ingredients', 'instructions'}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'script' and (attrs.get('type') or '').lower() == 'application/ld+json':
+            self.in_ld = True
+            self.ld_parts = []
+        elif tag in self.CONTAINERS:
+            classes = attrs.get('class') or ''
+            kind = None
+            if INGREDIENTS_CLASS_RE.search(classes):
+                kind = 'ingredients'
+            elif INSTRUCTIONS_CLASS_RE.search(classes) and 'ingredients' in self.closed_sections:
+                kind = 'instructions'
+            # [tag, section kind, li/p elements inside]
+            self.stack.append([tag, kind, 0])
+        elif tag in ('li', 'p'):
+            for entry in self.stack:
+                entry[2] += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'script' and self.in_ld:
+            self.in_ld = False
+            self._read_ld(''.join(self.ld_parts))
+        elif tag in self.CONTAINERS:
+            # Pop to the matching open tag; tolerates unclosed children
+            while self.stack:
+                open_tag, kind, items = self.stack.pop()
+                if kind and items and not any(entry[1] == kind for entry in self.stack):
+                    self.closed_sections.add(kind)
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.in_ld:
+            self.ld_parts.append(data)
+
+    def _read_ld(self, text):
+        try:
+            recipe_ld = find_recipe_ld(json.loads(text))
+        except ValueError:
+            return
+        if recipe_ld and recipe_ld.get('recipeIngredient') and recipe_ld.get('recipeInstructions'):
+            self.recipe_ld = recipe_ld
+
+
+class FetchedPage:
+    def __init__(self, content, headers, recipe_ld, bytes_read, bytes_saved, stopped_early, truncated):
+        self.content = content
+        self.headers = headers
+        self.recipe_ld = recipe_ld
+        self.bytes_read = bytes_read
+        self.bytes_saved = bytes_saved
+        self.stopped_early = stopped_early
+        self.truncated = truncated
+
+
+def fetch_page(url, etag='', last_modified='', max_bytes=None):
+    """
+    Download a recipe page in chunks; returns a FetchedPage, or None on 304.
+
+    Non-HTML responses are rejected from their Content-Type before the body
+    is read. Reading stops at max_bytes (default MAX_PAGE_BYTES), or as
+    soon as PageWatcher sees the recipe is complete; bytes_saved is what
+    the server would still have sent, when its Content-Length says so.
+
+    PageWatcher runs in the calling thread even when parse_recipe_page goes
+    to the process pool: a page without recipe markers is tokenized in
+    Python up to max_bytes while holding the GIL. Lower SCRAPER_MAX_BYTES
+    to bound that work per request.
+    """
+    max_bytes = MAX_PAGE_BYTES if max_bytes is None else max_bytes
+    headers = dict(HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    with requests.get(url, headers=headers, timeout=10, stream=True) as resp:
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type and content_type not in HTML_CONTENT_TYPES:
+            raise Exception(f"Not an HTML page (Content-Type: {content_type})")
+
+        watcher = PageWatcher()
+        # Only an explicit charset; requests would guess ISO-8859-1 for text/html
+        charset = CHARSET_RE.search(resp.headers.get('Content-Type', ''))
+        try:
+            decoder = codecs.getincrementaldecoder(charset.group(1) if charset else 'utf-8')(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        chunks = []
+        size = 0
+        stopped_early = truncated = False
+        for chunk in resp.iter_content(FETCH_CHUNK_SIZE):
+            chunk = chunk[:max_bytes - size]
+            chunks.append(chunk)
+            size += len(chunk)
+            watcher.feed(decoder.decode(chunk))
+            if watcher.complete:
+                stopped_early = True
+                break
+            if size >= max_bytes:
+                truncated = True
+                break
+
+        bytes_saved = 0
+        if stopped_early or truncated:
+            content_length = resp.headers.get('Content-Length', '')
+            if content_length.isdigit():
+                bytes_saved = max(0, int(content_length) - resp.raw.tell())
+
+        return FetchedPage(
+            b''.join(chunks), resp.headers, watcher.recipe_ld,
+            size, bytes_saved, stopped_early, truncated,
+        )
+
+
+def parse_recipe_page(content, url):
+    """
+    Parse page bytes and run the extractors for url.
+
+    Takes and returns only plain values so it can run in a worker process;
+    the caller records the stats.
+    """
+    started = time.perf_counter()
+    soup = BeautifulSoup(content, 'html.parser')
+    extractor = get_extractor(url)
+
+    # Enhanced title extraction
+    title = extract_title(soup, url, extractor)
+
+    # Enhanced ingredients extraction
+    ingredients, ingredients_matched = _extract_ingredients(soup, extractor)
+
+    # Enhanced instructions extraction
+    instructions, instructions_matched = _extract_instructions(soup, extractor)
+
+    return {
+        'title': title,
+        'ingredients': ingredients,
+        'instructions': instructions,
+        'ingredients_matched': ingredients_matched,
+        'instructions_matched': instructions_matched,
+        'parse_seconds': time.perf_counter() - started,
+    }
+
+
+def scrape_recipe(url, etag='', last_modified=''):
     """
     Enhanced scraper for multiple recipe websites with improved data extraction
     Supports: BBC Good Food, AllRecipes, and a variety of Indian recipe sites.
+
+    Given the etag/last_modified of an earlier fetch, the request is
+    conditional and None is returned if the page has not changed.
     """
 
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        
-        soup = BeautifulSoup(resp.content, 'html.parser')
-        
-        # Enhanced title extraction
-        title = extract_title(soup, url)
-        
-        # Enhanced ingredients extraction
-        ingredients = extract_ingredients(soup, url)
-        
-        # Enhanced instructions extraction
-        instructions = extract_instructions(soup, url)
-        
+        page = fetch_page(url, etag, last_modified)
+        if page is None:
+            return None
+
+        started = time.perf_counter()
+        site, extractor = match_host(url)
+        title = ingredients = instructions = None
+        if page.recipe_ld:
+            # Structured data is what the site itself says the recipe is
+            title, ingredients, instructions = recipe_from_ld(page.recipe_ld)
+        matched = bool(ingredients)
+        parse_seconds = time.perf_counter() - started
+
+        if not (title and ingredients and instructions):
+            # CPU-bound; may run in the parse worker pool
+            parsed = get_parse_executor().run(parse_recipe_page, page.content, url)
+            title = title or parsed['title']
+            if not ingredients:
+                ingredients, matched = parsed['ingredients'], parsed['ingredients_matched']
+            if not instructions:
+                instructions = parsed['instructions']
+                matched = matched and parsed['instructions_matched']
+            parse_seconds += parsed['parse_seconds']
+
+        extractor_stats.record(
+            site,
+            matched,
+            parse_seconds,
+            page,
+            jsonld=bool(page.recipe_ld),
+            extractor=extractor.name if extractor else None,
+        )
+
         if not title or not ingredients:
             raise Exception("Could not extract recipe data from this URL")
-        
+
         return {
             'title': title,
             'ingredients': ingredients,
             'instructions': instructions,
-            'source_url': url
+            'source_url': url,
+            'etag': page.headers.get('ETag', ''),
+            'last_modified': page.headers.get('Last-Modified', ''),
         }
-        
+
     except requests.RequestException as e:
         raise Exception(f"Failed to fetch URL: {str(e)}")
     except Exception as e:
         raise Exception(f"Error scraping recipe: {str(e)}")
-        
-def extract_title(soup, url):
+
+def extract_title(soup, url, extractor=None):
     """Extract recipe title based on website"""
-    if 'bbcgoodfood.com' in url:
-        # BBC Good Food
-        title_elem = soup.find('h1', class_='heading__title')
-        if title_elem:
-            return title_elem.get_text(strip=True)
-        
-        # Fallback for BBC Good Food
-        title_elem = soup.find('h1')
-        if title_elem:
-            return title_elem.get_text(strip=True)
-    
-    elif 'allrecipes.com' in url:
-        # AllRecipes
-        title_elem = soup.find('h1', class_='recipe-title')
-        if title_elem:
-            return title_elem.get_text(strip=True)
-    
-    elif any(site in url for site in [
-        'foodfood.com', 'indianhealthyrecipes.com', 'recipes.timesofindia.com', 
-        'archanaskitchen.com', 'food.ndtv.com', 'vegrecipesofindia.com',
-        'simplyrecipes.com', 'recipetineats.com'
-    ]):
-        # Common pattern for many recipe sites
-        title_elem = soup.find('h1', class_=re.compile(r'title|recipe-title|entry-title', re.IGNORECASE))
-        if title_elem:
-            return title_elem.get_text(strip=True)
-    
+    extractor = extractor or get_extractor(url)
+    if extractor:
+        title = extractor.extract_title(soup)
+        if title:
+            return title
+
     # Generic fallback
     title_elem = soup.find('h1')
     if title_elem:
         return title_elem.get_text(strip=True)
-    
+
     return "Recipe Title Not Found"
 
-def extract_ingredients(soup, url):
-    """Extract ingredients list based on website"""
-    ingredients = []
-    
-    if 'bbcgoodfood.com' in url:
-        # BBC Good Food - look for ingredients in list items
-        ingredient_containers = soup.find_all(['li', 'p'], class_=re.compile(r'ingredient|ingredients'))
-        if not ingredient_containers:
-            # Try to find ingredients in any list within the recipe section
-            recipe_sections = soup.find_all(['section', 'div'], class_=re.compile(r'recipe|ingredients'))
-            for section in recipe_sections:
-                list_items = section.find_all('li')
-                for item in list_items:
-                    text = ' '.join(item.stripped_strings)
-                    if text and len(text) > 3:  # Filter out empty or very short items
-                        ingredients.append(text)
-        else:
-            for container in ingredient_containers:
-                text = ' '.join(container.stripped_strings)
-                if text and len(text) > 3:
-                    ingredients.append(text)
-    
-    elif 'allrecipes.com' in url:
-        # AllRecipes
-        ingredient_elems = soup.find_all('span', class_='ingredients-item-name')
-        for elem in ingredient_elems:
-            text = ' '.join(elem.stripped_strings)
-            if text:
-                ingredients.append(text)
-
-    elif any(site in url for site in [
-        'foodfood.com', 'indianhealthyrecipes.com', 'recipes.timesofindia.com', 
-        'archanaskitchen.com', 'food.ndtv.com', 'simplyrecipes.com', 'recipetineats.com',
-        'vegrecipesofindia.com'
-    ]):        # Special handling for vegrecipesofindia.com to remove checkboxes
-        ingredient_container = soup.find('div', class_=re.compile(r'ingredients', re.IGNORECASE))
-        if ingredient_container:
-            list_items = ingredient_container.find_all('li')
-            for item in list_items:
-                text = ' '.join(item.stripped_strings)
-                if text:
-                    # Use regex to remove leading symbols (like checkboxes, bullets)
-                    cleaned_text = re.sub(r'^[\W\s]+', '', text)
-                    if cleaned_text:
-                        ingredients.append(cleaned_text)
-    
-    # Generic fallback - look for common ingredient patterns
-    if not ingredients:
-        # Look for any list items that might contain ingredients
-        all_list_items = soup.find_all('li')
-        for item in all_list_items:
-            text = ' '.join(item.stripped_strings)
-            # Simple heuristic: ingredients often contain measurements or food words
-            if (text and len(text) > 3 and 
-                any(word in text.lower() for word in ['cup', 'tbsp', 'tsp', 'gram', 'ounce', 'pound', 'kg', 'ml', 'g', 'oz', 'lb'])):
-                ingredients.append(text)
-    
-    return ingredients[:]  
+def _extract_ingredients(soup, extractor):
+    """Return (ingredients, found by site rules)"""
+    ingredients = extractor.extract_ingredients(soup) if extractor else []
+    if ingredients:
+        return ingredients, True
 
+    # Generic fallback - look for any list items that might contain ingredients
+    for item in soup.find_all('li'):
+        text = ' '.join(item.stripped_strings)
+        # Simple heuristic: ingredients often contain measurements or food words
+        if (text and len(text) > 3 and
+            any(word in text.lower() for word in MEASUREMENT_WORDS)):
+            ingredients.append(text)
 
+    return ingredients, False
 
-def extract_instructions(soup, url):
-    """Extract cooking instructions based on website"""
-    instructions = []
-    
-    if 'bbcgoodfood.com' in url:
-        # BBC Good Food - look for method/instructions
-        method_containers = soup.find_all(['li', 'p'], class_=re.compile(r'method|instruction|step'))
-        if not method_containers:
-            # Try to find numbered steps
-            step_containers = soup.find_all(['li', 'p'], class_=re.compile(r'step'))
-            if step_containers:
-                method_containers = step_containers
-        
-        for container in method_containers:
-            text = ' '.join(container.stripped_strings)
-            if text and len(text) > 10:  # Filter out very short items
-                instructions.append(text)
-
-    
-    elif 'allrecipes.com' in url:
-        # AllRecipes
-        instruction_elems = soup.find_all('div', class_='paragraph')
-        for elem in instruction_elems:
-            text = ' '.join(elem.stripped_strings)
-            if text:
-                instructions.append(text)
+def _extract_instructions(soup, extractor):
+    """Return (instructions, found by site rules)"""
+    instructions = extractor.extract_instructions(soup) if extractor else []
+    if instructions:
+        return instructions, True
 
-    elif 'simplyrecipes.com' in url:
-        instruction_container = soup.find('div', id='structured-project__steps_1-0')
-        if instruction_container:
-            instruction_elems = instruction_container.find_all('p')
-            for elem in instruction_elems:
-                text = ' '.join(elem.stripped_strings)
-                if text and len(text) > 10:
-                    instructions.append(text)
+    # Generic fallback - look for paragraphs that might contain instructions
+    for p in soup.find_all('p'):
+        text = ' '.join(p.stripped_strings)
+        if text and len(text) > 20:  # Instructions are usually longer
+            instructions.append(text)
 
-    elif any(site in url for site in [
-        'foodfood.com', 'indianhealthyrecipes.com', 'recipes.timesofindia.com', 
-        'archanaskitchen.com', 'food.ndtv.com','vegrecipesofindia.com',
-        'recipetineats.com'
-    ]):
+    return instructions, False
 
-        # Common pattern for many recipe sites
-        instruction_container = soup.find(['div', 'ol'], class_=re.compile(r'method|instruction|procedure|recipe-instructions', re.IGNORECASE))
+def extract_ingredients(soup, url):
+    """Extract ingredients list based on website"""
+    return _extract_ingredients(soup, get_extractor(url))[0]
 
-        if instruction_container:
-            instruction_elems = instruction_container.find_all(['li', 'p'])
-            for elem in instruction_elems:
-                text = ' '.join(elem.stripped_strings)
-                if text and len(text) > 10:
-                    instructions.append(text)
-    
-    # Generic fallback
-    if not instructions:
-        # Look for paragraphs that might contain instructions
-        paragraphs = soup.find_all('p')
-        for p in paragraphs:
-            text = ' '.join(p.stripped_strings)
-            if text and len(text) > 20:  # Instructions are usually longer
-                instructions.append(text)
-
-    
-    return instructions[:]
+def extract_instructions(soup, url):
+    """Extract cooking instructions based on website"""
+    return _extract_instructions(soup, get_extractor(url))[0]
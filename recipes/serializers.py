@@ -0,0 +1,80 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Packed values at least this long are zlib-compressed
+COMPRESS_THRESHOLD = 512
+COMPRESS_LEVEL = 6
+
+# First byte of every packed value
+JSON, JSON_ZLIB, MSGPACK, MSGPACK_ZLIB = b'j', b'J', b'm', b'M'
+
+
+def pack(obj, compress=True):
+    """
+    Serialize a JSON-compatible value to bytes.
+
+    Uses msgpack when it is installed, else compact JSON; with compress,
+    values of COMPRESS_THRESHOLD bytes or more are zlib-compressed. A
+    one-byte header records the format, so either kind can be read back
+    whatever is installed at read time (msgpack data aside).
+    """
+    if msgpack is not None:
+        data, plain, compressed = msgpack.packb(obj), MSGPACK, MSGPACK_ZLIB
+    else:
+        data, plain, compressed = json.dumps(obj, separators=(',', ':')).encode(), JSON, JSON_ZLIB
+    if compress and len(data) >= COMPRESS_THRESHOLD:
+        return compressed + zlib.compress(data, COMPRESS_LEVEL)
+    return plain + data
+
+
+def unpack(data):
+    header, body = data[:1], data[1:]
+    if header in (JSON_ZLIB, MSGPACK_ZLIB):
+        body = zlib.decompress(body)
+        header = JSON if header == JSON_ZLIB else MSGPACK
+    if header == JSON:
+        return json.loads(body)
+    if header == MSGPACK:
+        return msgpack.unpackb(body)
+    # Written before this serializer (Django's JSONSerializer)
+    return json.loads(data)
+
+
+class CompactCacheSerializer:
+    """
+    Serializer for the Redis cache backend (OPTIONS['serializer']).
+
+    Like Django's RedisSerializer, plain ints are stored as-is so
+    cache.incr() keeps working for the breaker and rate-limit counters.
+    """
+
+    def dumps(self, obj):
+        if type(obj) is int:
+            return obj
+        return pack(obj)
+
+    def loads(self, data):
+        try:
+            return int(data)
+        except ValueError:
+            return unpack(data)
+
+
+class CompactSessionSerializer:
+    """
+    SESSION_SERIALIZER that packs with msgpack when available.
+
+    Session signing already zlib-compresses its payload, so values are not
+    compressed twice. Sessions written by JSONSerializer still load.
+    """
+
+    def dumps(self, obj):
+        return pack(obj, compress=False)
+
+    def loads(self, data):
+        return unpack(data)
@@ -0,0 +1,38 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .charts import bump_favorites_version
+from .db import configure_sqlite
+from .dedup import lsh_index
+from .models import Favorite, Recipe
+from .similarity import recipe_index
+
+
+@receiver(post_save, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    """Keep the similarity index in step with saved recipes"""
+    if recipe_index.loaded_at is not None:
+        recipe_index.add(instance.id, instance.nutrition)
+    if lsh_index.loaded_at is not None:
+        lsh_index.add(instance.id, instance.minhash)
+    # Favorites charts that include this recipe are now stale
+    if not kwargs.get('created'):
+        for user_id in Favorite.objects.filter(recipe=instance).values_list('user_id', flat=True):
+            bump_favorites_version(user_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_recipe(sender, instance, **kwargs):
+    recipe_index.remove(instance.id)
+    lsh_index.remove(instance.id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorites_changed(sender, instance, **kwargs):
+    """Invalidate the user's cached favorites chart"""
+    bump_favorites_version(instance.user_id)
+
+
+connection_created.connect(configure_sqlite)
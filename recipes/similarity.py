@@ -0,0 +1,239 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection
+
+from .food_index import NUTRIENT_FIELDS
+
+# Rough per-recipe magnitudes so a gram of fiber and a calorie weigh comparably
+NUTRIENT_SCALES = {'calories': 500.0, 'protein': 25.0, 'fat': 20.0, 'carbs': 60.0, 'fiber': 8.0}
+
+# Points added since the last build are scanned linearly; rebuild past this
+REBUILD_THRESHOLD = 256
+
+# How often (seconds) a worker pulls recipes saved or deleted by other processes
+REFRESH_INTERVAL = 30
+
+# Rows saved this long before the newest one seen are re-read on refresh, so a
+# transaction that commits after a later one still gets picked up
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def nutrient_vector(nutrition):
+    """Scale a nutrition dict into a point for the index, or None if empty"""
+    if not nutrition:
+        return None
+    return tuple(float(nutrition.get(field, 0) or 0) / NUTRIENT_SCALES[field] for field in NUTRIENT_FIELDS)
+
+
+def _distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+class KDTree:
+    """Static k-d tree over (point, key) pairs with filtered k-nearest search"""
+
+    def __init__(self, items):
+        self.size = len(items)
+        self.root = self._build(list(items), 0)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % len(items[0][0])
+        items.sort(key=lambda item: item[0][axis])
+        middle = len(items) // 2
+        point, key = items[middle]
+        return (point, key, axis,
+                self._build(items[:middle], depth + 1),
+                self._build(items[middle + 1:], depth + 1))
+
+    def nearest(self, target, k, accept, heap):
+        """
+        Push the k nearest accepted keys into heap as (-distance, key).
+
+        heap is shared with the caller so results from other sources (the
+        unindexed buffer) prune this search too.
+        """
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, key, axis, left, right = node
+            if accept(key):
+                dist = _distance(point, target)
+                if len(heap) < k:
+                    heapq.heappush(heap, (-dist, key))
+                elif dist < -heap[0][0]:
+                    heapq.heapreplace(heap, (-dist, key))
+
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Visit the far side only if the splitting plane is within range
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                stack.append(far)
+            stack.append(near)
+
+
+class RecipeIndex:
+    """
+    In-memory nearest-neighbour index of recipe nutrient vectors.
+
+    Points live in a k-d tree plus a small unindexed buffer of recent
+    additions; queries search both, and the tree is rebuilt once the buffer
+    grows past REBUILD_THRESHOLD so ingestion never pays for a full rebuild.
+    """
+
+    def __init__(self):
+        self.points = {}
+        self.tree = KDTree([])
+        self.pending = set()
+        self.synced_to = None
+        self.loaded_at = None
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, recipe_id, nutrition):
+        vector = nutrient_vector(nutrition)
+        with self.lock:
+            if vector is None:
+                self._discard(recipe_id)
+                return
+            self.points[recipe_id] = vector
+            self.pending.add(recipe_id)
+            if len(self.pending) > REBUILD_THRESHOLD:
+                self._rebuild()
+
+    def remove(self, recipe_id):
+        with self.lock:
+            self._discard(recipe_id)
+
+    def _discard(self, recipe_id):
+        # Stale tree entries are skipped at query time via self.points
+        self.points.pop(recipe_id, None)
+        self.pending.discard(recipe_id)
+
+    def _rebuild(self):
+        self.tree = KDTree([(point, key) for key, point in self.points.items()])
+        self.pending = set()
+
+    def refresh(self):
+        """
+        Apply recipes saved or deleted by any process since the last refresh.
+
+        Rows whose updated_at is past the newest one loaded so far are
+        (re)applied like add(); when the row count then disagrees with the
+        index, the stored ids are read to drop deleted recipes. An unchanged
+        table costs two indexed queries and no rebuild.
+        """
+        from .models import Recipe
+
+        recipes = Recipe.objects.exclude(nutrition={})
+        changed = recipes
+        if self.synced_to is not None:
+            changed = recipes.filter(updated_at__gte=self.synced_to - SYNC_OVERLAP)
+        rows = list(changed.values_list('id', 'nutrition', 'updated_at'))
+        count = recipes.count()
+
+        with self.lock:
+            for recipe_id, nutrition, updated_at in rows:
+                vector = nutrient_vector(nutrition)
+                if vector is None:
+                    self._discard(recipe_id)
+                elif self.points.get(recipe_id) != vector:
+                    self.points[recipe_id] = vector
+                    self.pending.add(recipe_id)
+                if self.synced_to is None or updated_at > self.synced_to:
+                    self.synced_to = updated_at
+            stale = count != len(self.points)
+        if stale:
+            ids = set(recipes.values_list('id', flat=True))
+            with self.lock:
+                for recipe_id in [key for key in self.points if key not in ids]:
+                    self._discard(recipe_id)
+
+        with self.lock:
+            if self.loaded_at is None or len(self.pending) > REBUILD_THRESHOLD:
+                self._rebuild()
+            self.loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # loaded_at is unchanged, so the next request tries again
+            print(f"Error refreshing the similarity index: {e}")
+        finally:
+            # This thread's connection would otherwise stay open
+            connection.close()
+            self.refresh_lock.release()
+
+    def ensure_fresh(self):
+        """
+        Load the index on first use, then keep it current off the request path.
+
+        Once loaded, a stale index is still served while a background thread
+        refreshes it; at most one refresh runs at a time.
+        """
+        if self.loaded_at is None:
+            with self.refresh_lock:
+                if self.loaded_at is None:
+                    self.refresh()
+            return
+        if time.monotonic() - self.loaded_at > REFRESH_INTERVAL and self.refresh_lock.acquire(blocking=False):
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+    def nearest(self, nutrition, k=5, exclude=(), lighter=False):
+        """
+        Return up to k recipe ids closest to nutrition, best first.
+
+        With lighter=True only recipes with fewer calories than the query
+        are considered, for "similar but lighter" suggestions.
+        """
+        target = nutrient_vector(nutrition)
+        if target is None or k <= 0:
+            return []
+        exclude = set(exclude)
+        calories = NUTRIENT_FIELDS.index('calories')
+
+        with self.lock:
+            points = self.points
+
+            def accept(key):
+                point = points.get(key)
+                if point is None or key in exclude:
+                    return False
+                return not lighter or point[calories] < target[calories]
+
+            heap = []
+            for key in self.pending:
+                if accept(key):
+                    dist = _distance(points[key], target)
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-dist, key))
+                    elif dist < -heap[0][0]:
+                        heapq.heapreplace(heap, (-dist, key))
+            # Tree entries re-added since the build are already counted above
+            pending = self.pending
+            self.tree.nearest(target, k, lambda key: key not in pending and accept(key), heap)
+
+        return [key for _, key in sorted(heap, key=lambda item: -item[0])]
+
+
+recipe_index = RecipeIndex()
+
+
+def similar_recipes(nutrition, k=5, exclude=(), lighter=False):
+    """Recipes nutritionally closest to nutrition, in ranked order"""
+    from .models import Recipe
+
+    recipe_index.ensure_fresh()
+    ids = recipe_index.nearest(nutrition, k=k, exclude=exclude, lighter=lighter)
+    recipes = Recipe.objects.in_bulk(ids)
+    return [recipes[i] for i in ids if i in recipes]
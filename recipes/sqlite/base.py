@@ -0,0 +1,40 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend whose transactions can start with BEGIN IMMEDIATE.
+
+    A deferred transaction that reads before it writes must upgrade its
+    lock at the first write, and if another connection is writing by then
+    SQLite fails at once with "database is locked" instead of waiting out
+    busy_timeout. BEGIN IMMEDIATE takes the write lock up front, so
+    concurrent atomic() blocks (update_or_create, get_or_create, session
+    saves) queue on busy_timeout instead. Set with
+    OPTIONS['transaction_mode'], the option Django 5.1 added to its own
+    backend.
+    """
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        mode = settings_dict['OPTIONS'].get('transaction_mode')
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, not {mode!r}"
+            )
+        self.transaction_mode = mode.upper() if mode else None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Not a sqlite3.connect() argument
+        params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -1,3 +1,630 @@
-from django.test import TestCase
+import json
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .db import ReadRouter
+from .dedup import LSHIndex
+from .breaker import CircuitBreaker
+from .bulk import import_rows
+from .charts import bump_favorites_version, favorites_version
+from .checks import check_breaker_cache, check_rate_limit_cache
+from .executors import ExecutorBusy, ProcessExecutor
+from .food_index import FoodIndex
+from .loadtest import STUB_LAYOUTS, StubHandler, start_stub, stub_recipe_page, stub_recipe_url
+from .models import Favorite, LineNutrition, Recipe
+from .nutrition import (
+    FALLBACK_NUTRITION, RULES_VERSION, get_fallback_nutrition, line_fingerprint, recompute_nutrition,
+)
+from .optimizer import optimize_ingredients, parse_targets, targets_met
+from .pipeline import refresh_recipe, run_recipe_pipeline
+from .ratelimit import TokenBucket
+from .scraper import FETCH_CHUNK_SIZE, ExtractorStats, PageWatcher, fetch_page, match_host, parse_recipe_page
+from .similarity import RecipeIndex
+from .sqlite.base import DatabaseWrapper
+
+
+class FoodIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = FoodIndex(FALLBACK_NUTRITION)
+
+    def test_exact_and_plural_lines(self):
+        self.assertEqual(self.index.match('2 tbsp butter'), 'butter')
+        self.assertEqual(self.index.match('3 eggs, beaten'), 'egg')
+        self.assertEqual(self.index.match('1 cup almond milk'), 'almond milk')
+
+    def test_partial_food_name_does_not_match(self):
+        self.assertIsNone(self.index.match('1 cup almonds'))
+        self.assertEqual(self.index.search('2 tbsp butter', limit=5), [((1.0, 1.0), 'butter')])
+
+    def test_qualified_food_does_not_match(self):
+        self.assertIsNone(self.index.match('2 tbsp peanut butter'))
+        self.assertIsNone(self.index.match('1 cup coconut milk'))
+        self.assertEqual(self.index.match('2 tbsp unsalted butter'), 'butter')
+        self.assertEqual(self.index.match('1 tbsp olive oil'), 'oil')
+
+    def test_everyday_qualifiers_still_match(self):
+        self.assertEqual(self.index.match('1 tsp kosher salt'), 'salt')
+        self.assertEqual(self.index.match('1/2 tsp sea salt'), 'salt')
+        self.assertEqual(self.index.match('1 cup powdered sugar'), 'sugar')
+        self.assertEqual(self.index.match('1 stick butter'), 'butter')
+
+    def test_longer_food_name_does_not_match_the_shorter_food(self):
+        self.assertIsNone(self.index.match('1 cup sugar snap peas'))
+        self.assertIsNone(self.index.match('1 can butter beans'))
+
+    def test_separate_foods_in_one_line(self):
+        self.assertEqual(self.index.match('pepper and salt'), 'salt')
+        self.assertEqual(self.index.match('salt, pepper'), 'salt')
+
+
+class OptimizerTests(SimpleTestCase):
+    # Fallback calories: milk 42, butter 102, egg 68; their vegan
+    # substitutions: almond milk 17, vegan butter 90, flaxseed meal 37
+    ingredients = ['1 cup milk', '2 tbsp butter', '1 egg']
+
+    def test_parse_targets_rejects_non_finite_values(self):
+        targets = parse_targets({'max_calories': 'nan', 'min_protein': 'inf', 'max_fat': '20',
+                                 'max_carbs': 'abc', 'min_fiber': ''})
+        self.assertEqual(targets, {'max_fat': 20.0})
+
+    def test_meets_targets_with_fewest_changes(self):
+        result = optimize_ingredients(self.ingredients, {'max_calories': 190})
+        self.assertTrue(result['feasible'])
+        self.assertTrue(result['optimal'])
+        self.assertEqual(result['changed_lines'], 1)
+        self.assertLessEqual(result['estimated_nutrition']['calories'], 190)
+
+    def test_needs_every_substitution(self):
+        result = optimize_ingredients(self.ingredients, {'max_calories': 150})
+        self.assertTrue(result['feasible'])
+        self.assertEqual(result['changed_lines'], 3)
+        self.assertEqual(result['estimated_nutrition']['calories'], 144)
+
+    def test_infeasible_targets_get_closest_variant(self):
+        result = optimize_ingredients(self.ingredients, {'max_calories': 10})
+        self.assertFalse(result['feasible'])
+        self.assertEqual(result['estimated_nutrition']['calories'], 144)
+
+    def test_restriction_limits_options(self):
+        result = optimize_ingredients(['1 cup milk'], {'min_protein': 0}, restriction='vegan')
+        self.assertEqual(result['ingredients'], ['1 cup almond milk'])
+
+    def test_targets_met_checks_every_target(self):
+        nutrition = {'calories': 500, 'protein': 20, 'fat': 10, 'carbs': 60, 'fiber': 4}
+        self.assertTrue(targets_met(nutrition, {'max_calories': 500, 'min_protein': 20}))
+        self.assertFalse(targets_met(nutrition, {'max_calories': 500, 'min_protein': 25}))
+
+    def test_exhausted_budget_is_not_optimal(self):
+        result = optimize_ingredients(self.ingredients, {'max_calories': 150}, budget=0)
+        self.assertFalse(result['optimal'])
+        self.assertEqual(len(result['ingredients']), len(self.ingredients))
+
+
+class ExtractorStatsTests(SimpleTestCase):
+    def test_sites_are_keyed_by_registered_host(self):
+        self.assertEqual(match_host('https://www.recipetineats.com/x')[0], 'recipetineats.com')
+        self.assertEqual(match_host('https://m.allrecipes.com/x')[0], 'allrecipes.com')
+        self.assertEqual(match_host('https://www.example.org/x'), ('example.org', None))
+
+    def test_sites_sharing_an_extractor_are_counted_apart(self):
+        stats = ExtractorStats(max_domains=2)
+        stats.record('recipetineats.com', True, 0.01, extractor='common')
+        stats.record('foodfood.com', False, 0.01, extractor='common')
+        stats.record('example.org', False, 0.01)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['recipetineats.com']['success_rate'], 1.0)
+        self.assertEqual(snapshot['foodfood.com']['extractor'], 'common')
+        self.assertEqual(snapshot['other']['extractor'], 'generic')
+
+
+class PageHandler(StubHandler):
+    """Serves the pages FetchPageTests reads, each followed by plenty of filler"""
+    filler = '<p>' + 'x' * 100 + '</p>'
+    ingredients = '<div class="ingredients"><ul><li>1 cup milk</li><li>2 eggs</li></ul></div>'
+    instructions = '<ol class="recipe-instructions"><li>Whisk everything together.</li></ol>'
+    recipe_ld = json.dumps({'@type': 'Recipe', 'name': 'Pancakes', 'recipeIngredient': ['1 cup milk'],
+                            'recipeInstructions': [{'@type': 'HowToStep', 'text': 'Whisk.'}]})
+
+    def respond(self, path):
+        padding = self.filler * 5000
+        if path == '/ld':
+            body = f'<script type="application/ld+json">{self.recipe_ld}</script>{padding}'
+        elif path == '/sections':
+            body = f'<h1>Pancakes</h1>{self.ingredients}{self.instructions}{padding}'
+        elif path == '/json':
+            self.send_body(200, 'application/json', '{}')
+            return
+        elif path == '/etag' and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        else:
+            body = padding
+        self.send_body(200, 'text/html; charset=utf-8', f'<html><body>{body}</body></html>')
+
+
+class FetchPageTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub(PageHandler)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def fetch(self, path, **kwargs):
+        return fetch_page(self.server.base_url + path, **kwargs)
+
+    def test_stops_once_json_ld_recipe_is_read(self):
+        page = self.fetch('/ld')
+        self.assertEqual(page.recipe_ld['name'], 'Pancakes')
+        self.assertTrue(page.stopped_early)
+        self.assertFalse(page.truncated)
+        self.assertLessEqual(page.bytes_read, FETCH_CHUNK_SIZE)
+        self.assertEqual(page.bytes_read + page.bytes_saved, int(page.headers['Content-Length']))
+
+    def test_stops_once_ingredient_and_instruction_sections_close(self):
+        page = self.fetch('/sections')
+        self.assertIsNone(page.recipe_ld)
+        self.assertTrue(page.stopped_early)
+        self.assertGreater(page.bytes_saved, 0)
+
+    def test_page_without_markers_is_cut_at_the_byte_cap(self):
+        page = self.fetch('/plain', max_bytes=100_000)
+        self.assertTrue(page.truncated)
+        self.assertFalse(page.stopped_early)
+        self.assertEqual(page.bytes_read, 100_000)
+        self.assertEqual(len(page.content), 100_000)
+
+    def test_non_html_is_rejected(self):
+        with self.assertRaisesMessage(Exception, 'Not an HTML page (Content-Type: application/json)'):
+            self.fetch('/json')
+
+    def test_not_modified_returns_none(self):
+        self.assertIsNone(self.fetch('/etag', etag='"v1"'))
+        self.assertIsNotNone(self.fetch('/etag', etag='"v0"'))
+
+    def test_watcher_needs_instructions_after_ingredients(self):
+        watcher = PageWatcher()
+        watcher.feed(PageHandler.instructions + PageHandler.ingredients)
+        self.assertFalse(watcher.complete)
+        watcher.feed(PageHandler.instructions)
+        self.assertTrue(watcher.complete)
+
+
+class ProcessExecutorTests(SimpleTestCase):
+    def test_timed_out_task_keeps_its_slot(self):
+        executor = ProcessExecutor(workers=1, max_pending=1, timeout=0.1)
+        self.addCleanup(executor.shutdown)
+        self.assertNotEqual(executor.run(os.getpid), os.getpid())
+        with self.assertRaises(TimeoutError):
+            executor.run(time.sleep, 0.5)
+        with self.assertRaises(ExecutorBusy):
+            executor.run(os.getpid)
+        time.sleep(0.6)
+        self.assertIsInstance(executor.run(os.getpid), int)
+
+    def test_broken_pool_answers_inline_and_restarts(self):
+        executor = ProcessExecutor(workers=1, max_pending=1, timeout=1)
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool
+        executor.pool = broken
+        self.assertEqual(executor.run(os.getpid), os.getpid())
+        self.assertIsNone(executor.pool)
+        broken.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+        # A worker dying mid-task is answered inline too, and frees its slot
+        broken.reset_mock()
+        broken.submit.side_effect = None
+        broken.submit.return_value.result.side_effect = BrokenProcessPool
+        executor.pool = broken
+        self.assertEqual(executor.run(os.getpid), os.getpid())
+        self.assertIsNone(executor.pool)
+        broken.submit.return_value.add_done_callback.call_args[0][0](None)
+        self.assertTrue(executor.slots.acquire(blocking=False))
+
+
+class LoadTestStubTests(SimpleTestCase):
+    def test_stub_sites_are_parsed_by_their_own_extractors(self):
+        for number in range(len(STUB_LAYOUTS)):
+            url = stub_recipe_url(number)
+            layout = STUB_LAYOUTS[url.split('/')[2]]
+            _, extractor = match_host(url)
+            parsed = parse_recipe_page(stub_recipe_page(number, layout).encode(), url)
+            with self.subTest(layout=layout):
+                self.assertEqual(extractor.name if extractor else None,
+                                 layout if layout not in ('jsonld', 'generic') else None)
+                self.assertTrue(parsed['ingredients'] and parsed['instructions'])
+                self.assertEqual(parsed['ingredients_matched'] and parsed['instructions_matched'],
+                                 extractor is not None)
+
+
+class ReadRouterTests(SimpleTestCase):
+    def test_recipe_reads_go_to_read_outside_transactions(self):
+        router = ReadRouter()
+        default = mock.Mock(in_atomic_block=False)
+        with mock.patch('recipes.db.connections', {'default': default, 'read': mock.Mock()}):
+            self.assertEqual(router.db_for_read(Recipe), 'read')
+            self.assertIsNone(router.db_for_read(User))
+            # Inside a transaction reads must see its own writes
+            default.in_atomic_block = True
+            self.assertEqual(router.db_for_read(Recipe), 'default')
+        with mock.patch('recipes.db.connections', {'default': default}):
+            self.assertIsNone(router.db_for_read(Recipe))
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+        self.assertFalse(router.allow_migrate('read', 'recipes'))
+
+
+class SQLiteBackendTests(TransactionTestCase):
+    def test_transactions_begin_immediate(self):
+        connection = connections['default']
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Recipe.objects.get_or_create(source_url='https://a.example/soup', defaults={'title': 'Soup'})
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_unknown_transaction_mode_is_rejected(self):
+        settings_dict = {**connections['default'].settings_dict, 'OPTIONS': {'transaction_mode': 'later'}}
+        with self.assertRaises(ImproperlyConfigured):
+            DatabaseWrapper(settings_dict)
+
+
+class RecipeIndexTests(TestCase):
+    def recipe(self, title, calories):
+        return Recipe.objects.create(title=title, instructions='', nutrition={'calories': calories})
+
+    def test_refresh_applies_changes_made_elsewhere(self):
+        light, heavy, gone = self.recipe('Light', 200), self.recipe('Heavy', 900), self.recipe('Gone', 600)
+        index = RecipeIndex()
+        index.refresh()
+        self.assertEqual(index.nearest({'calories': 250}, k=1), [light.id])
+
+        # Queryset writes skip the signals, as writes from another process would
+        Recipe.objects.filter(id=heavy.id).update(nutrition={'calories': 260}, updated_at=timezone.now())
+        Recipe.objects.filter(id=light.id).update(nutrition={}, updated_at=timezone.now())
+        Recipe.objects.filter(id=gone.id)._raw_delete(Recipe.objects.db)
+        index.refresh()
+
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.nearest({'calories': 250}, k=5), [heavy.id])
+
+    def test_unchanged_table_is_not_rebuilt(self):
+        self.recipe('Light', 200)
+        index = RecipeIndex()
+        index.refresh()
+        tree = index.tree
+        index.refresh()
+        self.assertIs(index.tree, tree)
+
+
+class PipelineTestCase(TestCase):
+    """Runs the pipeline against a canned page, the fallback nutrition table and a private LSH index"""
+    lines = ['1 cup milk', '2 tbsp butter', '1 egg', '2 cups flour']
+
+    def setUp(self):
+        cache.clear()
+        index = LSHIndex()
+        self.scrape_recipe = mock.Mock(side_effect=self.scrape)
+        for target, kwargs in [
+            ('recipes.dedup.lsh_index', {'new': index}),
+            ('recipes.signals.lsh_index', {'new': index}),
+            ('recipes.pipeline.scrape_recipe', {'new': self.scrape_recipe}),
+            ('recipes.nutrition.get_fdc_id', {'return_value': None}),
+        ]:
+            patcher = mock.patch(target, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def scrape(self, url, etag='', last_modified=''):
+        return {
+            'title': 'Pancakes',
+            'ingredients': list(self.lines),
+            'instructions': ['Mix.', 'Fry.'],
+            'etag': '',
+            'last_modified': '',
+        }
+
+
+class DuplicateIngestionTests(PipelineTestCase):
+    original = 'https://a.example/pancakes'
+    syndicated = 'https://b.example/pancakes'
+
+    def test_resubmitted_original_is_not_its_own_duplicate(self):
+        run_recipe_pipeline(self.original)
+        context = run_recipe_pipeline(self.syndicated)
+        self.assertEqual(context['duplicate_of'], self.original)
+
+        # Targets the lines already meet, so the signature still matches
+        context = run_recipe_pipeline(self.original, targets={'max_calories': 5000})
+        self.assertTrue(context['success'])
+        self.assertIsNone(context['duplicate_of'])
+        self.assertIsNone(Recipe.objects.get(source_url=self.original).duplicate_of_id)
+
+
+class RecipeContextTests(PipelineTestCase):
+    url = 'https://a.example/pancakes'
+
+    def test_variants_stay_cached_when_the_row_changes(self):
+        vegan = run_recipe_pipeline(self.url, 'vegan')
+        run_recipe_pipeline(self.url, '')
+        self.assertEqual(run_recipe_pipeline(self.url, 'vegan'), vegan)
+        self.assertEqual(self.scrape_recipe.call_count, 2)
+
+    def test_session_context_survives_another_submission(self):
+        response = self.client.post('/', {'url': self.url, 'restriction': 'vegan'})
+        self.assertRedirects(response, '/recipe/', fetch_redirect_response=False)
+        run_recipe_pipeline(self.url, '')
+
+        response = self.client.get('/recipe/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'almond milk')
+
+
+class TargetsTests(PipelineTestCase):
+    url = 'https://a.example/pancakes'
+    # Fallback calories: milk 42, butter 102, egg 68, flour 364 (576 in all)
+    targets = {'max_calories': 1000}
+
+    def setUp(self):
+        super().setUp()
+        LineNutrition.objects.create(fingerprint=line_fingerprint('1 cup milk'), line='1 cup milk', nutrition={
+            'calories': 1000, 'protein': 30, 'fat': 50, 'carbs': 40, 'fiber': 0})
+
+    def test_search_uses_stored_line_values(self):
+        context = run_recipe_pipeline(self.url, targets=self.targets)
+        self.assertIn('1 cup almond milk', context['modified_ingredients'])
+        self.assertLessEqual(context['nutrition']['calories'], 1000)
+        self.assertTrue(context['optimization']['feasible'])
+
+    def test_final_totals_decide_whether_targets_were_met(self):
+        with mock.patch('recipes.pipeline.stored_or_fallback', return_value=get_fallback_nutrition):
+            context = run_recipe_pipeline(self.url, targets=self.targets)
+        self.assertIn('1 cup milk', context['modified_ingredients'])
+        self.assertGreater(context['nutrition']['calories'], 1000)
+        self.assertFalse(context['optimization']['feasible'])
+
+
+class RefreshTests(PipelineTestCase):
+    url = 'https://a.example/pancakes'
+
+    def scrape(self, url, etag=None, last_modified=None):
+        # Conditional fetches of the canned page always come back 304
+        if etag is not None:
+            return None
+        return super().scrape(url)
+
+    def test_rule_change_refetches_unmodified_page(self):
+        run_recipe_pipeline(self.url, 'vegan')
+        recipe = Recipe.objects.get(source_url=self.url)
+        self.assertEqual(recipe.rules_version, RULES_VERSION)
+        self.assertEqual(refresh_recipe(recipe)[0], 'not_modified')
+
+        Recipe.objects.filter(pk=recipe.pk).update(rules_version='0-old')
+        self.assertEqual(refresh_recipe(Recipe.objects.get(pk=recipe.pk))[0], 'unchanged')
+        self.assertEqual(self.scrape_recipe.call_args, mock.call(self.url))
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).rules_version, RULES_VERSION)
+
+    def test_update_drops_every_cached_context(self):
+        run_recipe_pipeline(self.url, 'vegan')
+        run_recipe_pipeline(self.url, '')
+        self.lines = self.lines + ['1 cup sugar']
+
+        status, changed = refresh_recipe(Recipe.objects.get(source_url=self.url), force=True)
+        self.assertEqual((status, changed), ('updated', ['1 cup sugar']))
+        for restriction in ('vegan', ''):
+            self.assertIn('1 cup sugar', run_recipe_pipeline(self.url, restriction)['original_ingredients'])
+        self.assertEqual(self.scrape_recipe.call_count, 5)
+
+    def test_update_marks_the_row_changed(self):
+        run_recipe_pipeline(self.url)
+        before = Recipe.objects.get(source_url=self.url).updated_at
+        self.lines = self.lines + ['1 cup sugar']
+        refresh_recipe(Recipe.objects.get(source_url=self.url), force=True)
+        self.assertGreater(Recipe.objects.get(source_url=self.url).updated_at, before)
+
+    def test_optimized_variant_that_fits_the_page_is_kept(self):
+        run_recipe_pipeline(self.url, targets={'max_calories': 5000})
+        with mock.patch('recipes.pipeline.optimize_ingredients') as optimize:
+            status, _ = refresh_recipe(Recipe.objects.get(source_url=self.url), force=True)
+        self.assertEqual(status, 'unchanged')
+        self.assertFalse(optimize.called)
+
+    @mock.patch('recipes.nutrition.ingredient_nutrition')
+    def test_lines_without_stored_results_are_looked_up(self, ingredient_nutrition):
+        ingredient_nutrition.return_value = ({'calories': 300, 'protein': 1, 'fat': 1, 'carbs': 1, 'fiber': 0}, False)
+        old = ['1 cup milk', '2 tbsp butter', '1 cup flour']
+        totals = {'calories': 900, 'protein': 3, 'fat': 3, 'carbs': 3, 'fiber': 0, 'estimated': []}
+
+        nutrition, changed = recompute_nutrition(old, totals, old + ['1 tsp salt'])
+        self.assertEqual((nutrition['calories'], nutrition['estimated']), (1200, []))
+        self.assertEqual(len(changed), 4)
+
+        # Lines estimated before stay estimates rather than being looked up again
+        LineNutrition.objects.all().delete()
+        totals['estimated'] = ['1 cup flour']
+        nutrition, changed = recompute_nutrition(old, totals, old + ['1 tsp salt'])
+        self.assertEqual(nutrition['estimated'], ['1 cup flour'])
+        self.assertEqual(changed, ['1 cup milk', '2 tbsp butter', '1 tsp salt'])
+
+
+class RecipeStreamTests(PipelineTestCase):
+    url = 'https://a.example/pancakes'
+
+    def events(self, response):
+        body = b''.join(response.streaming_content).decode()
+        return [block.split('\n')[0].removeprefix('event: ') for block in body.split('\n\n') if block]
+
+    def start_job(self):
+        response = self.client.post('/recipe/jobs/', {'url': self.url, 'restriction': 'vegan'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_job_streams_once_for_its_session(self):
+        job = self.start_job()
+        self.assertEqual(self.client.get(job['live_url']).status_code, 200)
+        stream_url = f"/recipe/stream/{job['job_id']}/"
+        self.assertEqual(self.events(self.client.get(stream_url))[-1], 'done')
+        self.assertEqual(self.events(self.client.get(stream_url)), ['failed'])
+        self.assertEqual(self.scrape_recipe.call_count, 1)
+
+    def test_stream_does_not_run_another_sessions_job(self):
+        job = self.start_job()
+        other = self.client_class()
+        self.assertEqual(self.events(other.get(f"/recipe/stream/{job['job_id']}/")), ['failed'])
+        self.assertFalse(self.scrape_recipe.called)
+
+    def test_jobs_are_only_started_by_post(self):
+        self.assertEqual(self.client.get('/recipe/jobs/', {'url': self.url}).status_code, 405)
+        self.assertEqual(self.events(self.client.get('/recipe/stream/unknown/')), ['failed'])
+        self.assertFalse(self.scrape_recipe.called)
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        patcher = mock.patch('recipes.ratelimit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_admits_a_burst_then_throttles(self):
+        bucket = TokenBucket(3, 60)
+        self.assertEqual([bucket.take('client') for _ in range(4)], [0, 0, 0, 20])
+
+    def test_bucket_refills_over_the_period(self):
+        bucket = TokenBucket(3, 60)
+        for _ in range(3):
+            bucket.take('client')
+        self.now += 20
+        self.assertEqual(bucket.take('client'), 0)
+        self.assertEqual(bucket.take('client'), 20)
+        # Idle past a full refill: a fresh burst, but never more than capacity
+        self.now += 600
+        self.assertEqual([bucket.take('client') for _ in range(4)], [0, 0, 0, 20])
+
+    @override_settings(RATE_LIMIT_ENABLED=True, RATE_LIMITS={
+        'login': {'methods': ['POST'], 'anonymous': (1, 60), 'authenticated': (1, 60)},
+    })
+    def test_throttled_request_gets_retry_after(self):
+        credentials = {'username': 'nobody', 'password': 'wrong'}
+        self.assertEqual(self.client.post('/login/', credentials).status_code, 200)
+        response = self.client.post('/login/', credentials)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(self.client.get('/login/').status_code, 200)
+
+    @override_settings(RATE_LIMIT_ENABLED=True)
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual([issue.id for issue in check_rate_limit_cache(None)], ['recipes.E001'])
+        with override_settings(RATE_LIMIT_ENABLED=False):
+            self.assertEqual(check_rate_limit_cache(None), [])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_opens_after_threshold_then_lets_one_probe_through(self):
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertEqual([breaker.allow(), breaker.allow()], [True, False])
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual([issue.id for issue in check_breaker_cache(None)], ['recipes.W002'])
+
+
+class FavoritesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cook', password='secret')
+        self.client.force_login(self.user)
+        self.recipe = Recipe.objects.create(title='Old soup', source_url='https://a.example/soup',
+                                            ingredients=['1 cup milk', '2 tbsp butter'])
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+
+    @mock.patch('recipes.nutrition.get_fdc_id', return_value=None)
+    def test_rows_without_nutrition_are_backfilled_by_command(self, get_fdc_id):
+        updated_at = self.recipe.updated_at
+        self.assertEqual(self.client.get('/favorite/').status_code, 200)
+        self.assertFalse(get_fdc_id.called)
+        self.assertEqual(Recipe.objects.get(pk=self.recipe.pk).nutrition, {})
+
+        call_command('backfill_nutrition', stdout=mock.Mock())
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.nutrition['calories'], 144)
+        self.assertGreater(recipe.updated_at, updated_at)
+
+
+    def test_chart_is_cached_per_favorites_version(self):
+        version = favorites_version(self.user.id)
+        with mock.patch('recipes.views.nutrition_pie_svg', return_value='<svg/>') as draw:
+            response = self.client.get('/favorite/chart.svg', {'v': version})
+            self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+            self.client.get('/favorite/chart.svg', {'v': version})
+            self.assertEqual(draw.call_count, 1)
+
+            other = Recipe.objects.create(title='Stew', source_url='https://a.example/stew')
+            Favorite.objects.create(user=self.user, recipe=other)
+            response = self.client.get('/favorite/chart.svg', {'v': version})
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            self.assertEqual(draw.call_count, 2)
+
+    def test_chart_drawn_during_a_change_is_not_cached(self):
+        version = favorites_version(self.user.id)
+
+        def totals_then_change(favorites):
+            bump_favorites_version(self.user.id)
+            return {}
+
+        with mock.patch('recipes.views.favorite_totals', side_effect=totals_then_change), \
+                mock.patch('recipes.views.nutrition_pie_svg', return_value='<svg/>'):
+            response = self.client.get('/favorite/chart.svg', {'v': version})
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIsNone(cache.get(f"favorite_chart_{self.user.id}_v{version}"))
+
+
+class ImportTests(TestCase):
+    rows = [
+        {'source_url': 'https://b.example/soup', 'title': 'Soup copy', 'duplicate_of_url': 'https://a.example/soup'},
+        {'source_url': 'https://a.example/soup', 'title': 'Soup', 'nutrition': {'calories': 300}},
+        {'source_url': None, 'title': 'No URL'},
+        {'source_url': 'https://b.example/soup', 'title': 'Soup copy', 'duplicate_of_url': 'https://a.example/soup'},
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_upserts_skip_url_less_rows_and_link_at_the_end(self):
+        stats = import_rows(self.rows, batch_size=1)
+        self.assertEqual((stats['rows'], stats['skipped'], stats['unlinked_duplicates']), (3, 1, 0))
+        stats = import_rows(self.rows, batch_size=1)
+        self.assertEqual(Recipe.objects.count(), 2)
+        copy = Recipe.objects.get(source_url='https://b.example/soup')
+        self.assertEqual(copy.duplicate_of.source_url, 'https://a.example/soup')
+
+    def test_updates_mark_rows_changed_and_invalidate_favorites(self):
+        import_rows(self.rows)
+        recipe = Recipe.objects.get(source_url='https://a.example/soup')
+        user = User.objects.create_user('cook')
+        Favorite.objects.create(user=user, recipe=recipe)
+        version = favorites_version(user.id)
+
+        rows = [dict(self.rows[1], nutrition={'calories': 250})]
+        import_rows(rows)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.nutrition, {'calories': 250})
+        self.assertGreater(recipe.updated_at, Favorite.objects.get().created_at)
+        self.assertNotEqual(favorites_version(user.id), version)
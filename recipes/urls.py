@@ -4,9 +4,16 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('recipe/', views.recipe_view, name='recipe'),
+    path('recipe/jobs/', views.start_recipe_job, name='recipe_job'),
+    path('recipe/live/', views.recipe_live, name='recipe_live'),
+    path('recipe/stream/<str:job_id>/', views.recipe_stream, name='recipe_stream'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('signup/', views.signup_view, name='signup'),
     path('favorite/', views.favorite_list, name='favorite'),
+    path('favorite/chart.svg', views.favorite_chart, name='favorite_chart'),
     path('toggle-favorite/', views.toggle_favorite, name='toggle_favorite'),
+    path('scraper-stats/', views.scraper_stats, name='scraper_stats'),
+    path('rate-limits/', views.rate_limits, name='rate_limits'),
+    path('export/recipes/', views.export_recipes, name='export_recipes'),
 ]
@@ -3,73 +3,33 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.core.cache import cache
+from django.urls import reverse
 
-from .scraper import scrape_recipe
-from .ml_utils import modify_ingredients
-from .nutrition import analyze_nutrition 
+from .scraper import extractor_stats
+from .ratelimit import rate_limit_stats
+from .bulk import csv_lines, iter_export_rows, ndjson_lines
+from .optimizer import parse_targets
+from .pipeline import (
+    claim_recipe_job, create_recipe_job, get_recipe_job, process_recipe, run_recipe_pipeline,
+)
+from .similarity import similar_recipes
+from .charts import CHART_TIMEOUT, favorites_version, nutrition_pie_svg
 from .models import Recipe, Favorite
 
-import traceback
+import json
 
 def index(request):
     # On POST, process the recipe and redirect to the recipe page
     if request.method == 'POST':
         url = request.POST.get('url')
         restriction = request.POST.get('restriction', '')
+        targets = parse_targets(request.POST)
 
-        # Create a unique cache key and try to get data from cache
-        cache_key = f"recipe_{url}_restriction_{restriction}"
-        recipe_context = cache.get(cache_key)
-
-        if not recipe_context:
-            try:
-                # Scrape the recipe
-                recipe = scrape_recipe(url)
-                
-                # Modify ingredients based on dietary restriction
-                modified_ingredients = recipe['ingredients']
-                if restriction:
-                    modified_ingredients = modify_ingredients(recipe['ingredients'], restriction)
-                
-                # Analyze nutrition (using API)
-                nutrition = analyze_nutrition(modified_ingredients)
-                
-                # Create or get recipe with all necessary data
-                recipe_obj, created = Recipe.objects.update_or_create(
-                    source_url=url,
-                    defaults={
-                        'title': recipe['title'],
-                        'instructions': '\n'.join(recipe['instructions']) if recipe['instructions'] else 'Instructions not found',
-                        'ingredients': modified_ingredients,
-                    }
-                )
-                                
-                # Prepare context for session and cache
-                recipe_context = {
-                    'title': recipe['title'],
-                    'original_ingredients': recipe['ingredients'],
-                    'modified_ingredients': recipe_obj.ingredients,
-                    'instructions': '\n'.join(recipe['instructions']) if recipe['instructions'] else 'Instructions not found',
-                    'nutrition': nutrition,
-                    'restriction': restriction,
-                    'recipe_id': recipe_obj.id,
-                    'success': True
-                }
-                
-                # Cache the result for 1 hour
-                cache.set(cache_key, recipe_context, 3600)
-
-            except Exception as e:
-                recipe_context = {
-                    'error': f"Error processing recipe: {str(e)}",
-                    'url': url,
-                    'restriction': restriction,
-                    'success': False
-                }
-                print(f"Error in recipe processing: {traceback.format_exc()}")
+        recipe_context = run_recipe_pipeline(url, restriction, targets)
         
         # Store context in session and redirect
         request.session['recipe_context'] = recipe_context
@@ -103,9 +63,95 @@ def recipe_view(request):
         
         favorite_count = Favorite.objects.filter(user=request.user).count()
         context['favorite_count'] = favorite_count
+
+    # Nutritionally similar recipes, preferring lighter ones
+    if context.get('success'):
+        exclude = [context['recipe_id']]
+        context['similar_recipes'] = (
+            similar_recipes(context['nutrition'], exclude=exclude, lighter=True)
+            or similar_recipes(context['nutrition'], exclude=exclude)
+        )
         
     return render(request, 'recipes/recipe.html', context)
                 
+@require_POST
+def start_recipe_job(request):
+    """Accept a recipe submission for streaming; the live page then subscribes to recipe_stream"""
+    url = request.POST.get('url')
+    if not url:
+        return JsonResponse({'success': False, 'message': 'No recipe URL given'}, status=400)
+
+    # Jobs belong to the session that submitted them
+    if not request.session.session_key:
+        request.session.create()
+    job_id = create_recipe_job(
+        request.session.session_key, url, request.POST.get('restriction', ''), parse_targets(request.POST)
+    )
+    return JsonResponse({
+        'success': True,
+        'job_id': job_id,
+        'live_url': f"{reverse('recipe_live')}?job={job_id}",
+    })
+
+def recipe_live(request):
+    """Recipe page shell that fills in progressively from recipe_stream"""
+    job_id = request.GET.get('job', '')
+    job = get_recipe_job(job_id)
+    if not job:
+        return redirect('index')
+
+    context = {
+        'success': True,
+        'streaming': True,
+        'stream_url': reverse('recipe_stream', args=[job_id]),
+        'restriction': job['restriction'],
+        'has_targets': bool(job['targets']),
+    }
+    if request.user.is_authenticated:
+        context['favorite_count'] = Favorite.objects.filter(user=request.user).count()
+    return render(request, 'recipes/recipe.html', context)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def recipe_stream(request, job_id):
+    """
+    Server-Sent Events stream of a submitted recipe job, one event per completed stage.
+
+    Opening the stream runs the job started by start_recipe_job, once and
+    only for the session that submitted it; anything else gets a single
+    'failed' event.
+    """
+    job = claim_recipe_job(job_id, request.session.session_key)
+    user = request.user
+
+    def events():
+        if job is None:
+            yield _sse('failed', {'error': 'This recipe request has expired. Please submit it again.',
+                                  'success': False})
+            return
+        for event, data in process_recipe(job['url'], job['restriction'], job['targets']):
+            if event == 'done':
+                data = dict(data)
+                data['is_favorite'] = user.is_authenticated and Favorite.objects.filter(
+                    user=user, recipe_id=data['recipe_id']
+                ).exists()
+                similar = (
+                    similar_recipes(data['nutrition'], exclude=[data['recipe_id']], lighter=True)
+                    or similar_recipes(data['nutrition'], exclude=[data['recipe_id']])
+                )
+                data['similar_recipes'] = [
+                    {'title': r.title, 'source_url': r.source_url, 'calories': r.nutrition.get('calories')}
+                    for r in similar
+                ]
+            yield _sse(event, data)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 def login_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -181,11 +227,8 @@ def toggle_favorite(request):
             'message': str(e)
         })
 
-@login_required
-def favorite_list(request):
-    """Display user's favorite recipes and their combined nutrition"""
-    favorites = Favorite.objects.filter(user=request.user).select_related('recipe')
-    
+def favorite_totals(favorites):
+    """Combined nutrition and pie chart percentages for a user's favorites"""
     # Initialize total nutrition values
     total_nutrition = {
         'protein': 0,
@@ -197,9 +240,10 @@ def favorite_list(request):
     
     # Loop through all favorite recipes to get their total nutrition
     for favorite in favorites:
-        recipe_ingredients = favorite.recipe.ingredients 
-        if recipe_ingredients:
-            nutrition_data = analyze_nutrition(recipe_ingredients)
+        # Nutrition is stored at ingestion; older rows without it are filled
+        # in by `manage.py backfill_nutrition`, not here
+        nutrition_data = favorite.recipe.nutrition
+        if favorite.recipe.ingredients and nutrition_data:
             total_nutrition['protein'] += nutrition_data.get('protein', 0)
             total_nutrition['fat'] += nutrition_data.get('fat', 0)
             total_nutrition['carbs'] += nutrition_data.get('carbs', 0)
@@ -222,8 +266,70 @@ def favorite_list(request):
         total_nutrition['fiber_percent'] = 0
         total_nutrition['calories_percent'] = 0
 
+    return total_nutrition
+
+@login_required
+def favorite_list(request):
+    """Display user's favorite recipes and their combined nutrition"""
+    favorites = Favorite.objects.filter(user=request.user).select_related('recipe').order_by('-created_at')
+    total_nutrition = favorite_totals(favorites)
+
+    # Recipes close to the average of the user's favorites
+    similar = []
+    if favorites:
+        average = {key: total_nutrition[key] / len(favorites) for key in ('calories', 'protein', 'fat', 'carbs', 'fiber')}
+        similar = similar_recipes(average, exclude=[favorite.recipe_id for favorite in favorites])
+
     context = {
         'favorites': favorites,
-        'total_nutrition': total_nutrition
+        'total_nutrition': total_nutrition,
+        'similar_recipes': similar,
+        'chart_version': favorites_version(request.user.id),
     }
     return render(request, 'recipes/favorite.html', context)
+
+@login_required
+def favorite_chart(request):
+    """Serve the favorites nutrition pie chart as a cached SVG"""
+    version = favorites_version(request.user.id)
+    cache_key = f"favorite_chart_{request.user.id}_v{version}"
+    svg = cache.get(cache_key)
+    current = True
+
+    if svg is None:
+        favorites = Favorite.objects.filter(user=request.user).select_related('recipe')
+        svg = nutrition_pie_svg(favorite_totals(favorites))
+        # Favorites that changed while the chart was drawn may not be in it;
+        # keep it out of the cache under the version read before
+        current = favorites_version(request.user.id) == version
+        if current:
+            cache.set(cache_key, svg, CHART_TIMEOUT)
+
+    response = HttpResponse(svg, content_type='image/svg+xml')
+    if current and request.GET.get('v') == str(version):
+        # The URL changes with every favorites change, so the browser can keep it
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@staff_member_required
+def scraper_stats(request):
+    """Per-site extractor success rates and parse times for this worker"""
+    return JsonResponse(extractor_stats.snapshot())
+
+@staff_member_required
+def rate_limits(request):
+    """Allowed and throttled request counts per rate-limited route"""
+    return JsonResponse(rate_limit_stats())
+
+@staff_member_required
+def export_recipes(request):
+    """Stream the whole recipe catalog as NDJSON (default) or CSV"""
+    if request.GET.get('format') == 'csv':
+        lines, content_type, filename = csv_lines(iter_export_rows()), 'text/csv', 'recipes.csv'
+    else:
+        lines, content_type, filename = ndjson_lines(iter_export_rows()), 'application/x-ndjson', 'recipes.ndjson'
+    response = StreamingHttpResponse(lines, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response